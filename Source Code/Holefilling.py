@@ -1,27 +1,277 @@
 from ball_pivoting_algo import BPA
+from Tracker import Edge, Triangle
+import helper
+import numpy as np
+import os
 import time
+
+# Number of triangles in a batch of mesh_radii.
+MESH_BATCH_SIZE = 4096
+
 def triangle_to_tuple(triangle):
     """
-    Converts a triangle object into a hashable tuple representation.
+    Converts a triangle object into a hashable tuple representation of its point ids.
     """
-    return tuple(sorted((vertex.x, vertex.y, vertex.z) for vertex in triangle.vertices))
-def Multiple_Pass(radii,input_path,limit):
-    combined_triangles = set()
-    #In this section the hole filling algorithm is implemeted
+    return tuple(sorted(triangle.vertices))
+def find_boundary_loops(bpa):
+    """
+    Find the closed loops of open edges of the mesh. Each loop goes over its edges in the other direction than the
+    triangles on them, which is the direction of the triangles that would fill it.
+
+    :param bpa: The BPA object with the mesh.
+    :return: List of the loops, each as a list of point ids. Open edges that do not close a loop are skipped.
+    """
+    # Next point of each point on the loops.
+    next_points = {}
+
+    for edge in bpa.find_open_edges():
+        third_point = bpa.grid.get_edge_faces(edge.p1, edge.p2)[0]
+        p1, p2 = bpa.orient_edge(edge.p1, edge.p2, third_point)
+        next_points.setdefault(p2, []).append(p1)
+
+    loops = []
+
+    while next_points:
+        start = next(iter(next_points))
+        loop = [start]
+        positions = {start: 0}
+
+        # Walk the loop until it gets back to its start, or gets stuck.
+        while True:
+            following = next_points.get(loop[-1])
+
+            if not following:
+                break
+
+            point = following.pop()
+
+            if not following:
+                del next_points[loop[-1]]
+
+            if point == start:
+                loops.append(loop)
+                break
+
+            if point in positions:
+                # The loop goes through this point twice. Split the part between the two visits to its own loop.
+                position = positions[point]
+                loops.append(loop[position:])
+
+                for removed_point in loop[position + 1:]:
+                    del positions[removed_point]
+
+                del loop[position + 1:]
+                continue
+
+            positions[point] = len(loop)
+            loop.append(point)
+
+    return loops
+
+
+def calc_loop_perimeter(bpa, loop):
+    """
+    Calculate the perimeter of a boundary loop.
+    """
+    coordinates = bpa.points.coordinates[loop]
+    return float(np.sum(helper.calc_distance_points(coordinates, np.roll(coordinates, -1, axis=0))))
+
+
+def fill_hole(bpa, loop):
+    """
+    Fill a boundary loop with triangles of its own points, by cutting the ear with the smallest angle each time.
+    Ears that would fold against the points normals, or connect points that are already connected, are skipped. The
+    last 3 points are always closed: their triangle is the only one, and goes the way of the triangles around it,
+    even where the mesh folds against the normals.
+
+    :param bpa: The BPA object with the mesh.
+    :param loop: List of the point ids of the loop, in the direction the new triangles go over its edges.
+    :return: List of the new triangles. The hole might not be filled completely.
+    """
+    coordinates, normals = bpa.points.coordinates, bpa.points.normals
+    loop = list(loop)
+    new_triangles = []
+
+    while len(loop) > 3:
+        previous_points, next_points = np.roll(loop, 1), np.roll(loop, -1)
+        a, b, c = coordinates[previous_points], coordinates[loop], coordinates[next_points]
+
+        # Angle of the loop in each point.
+        ba, bc = a - b, c - b
+        cosines = np.sum(ba * bc, axis=1) / (np.linalg.norm(ba, axis=1) * np.linalg.norm(bc, axis=1))
+        angles = np.arccos(np.clip(cosines, -1, 1))
+
+        # The ear must agree with the normals of its points.
+        ear_normals = np.cross(b - a, c - a)
+        is_valid = np.sum(ear_normals * (normals[previous_points] + normals[loop] + normals[next_points]), axis=1) > 0
+        angles[~is_valid] = np.inf
+
+        for i in np.argsort(angles, kind="stable").tolist():
+            if angles[i] == np.inf:
+                return new_triangles
+
+            p1, p2, p3 = int(previous_points[i]), loop[i], int(next_points[i])
+
+            if bpa.grid.get_edge(p1, p3) is not None:
+                continue
+
+            bpa.grid.add_edge(Edge(p1, p3))
+            bpa.grid.add_triangle([p1, p2, p3])
+            new_triangles.append(Triangle(p1, p2, p3))
+            del loop[i]
+            break
+        else:
+            return new_triangles
+
+    if len(loop) == 3:
+        bpa.grid.add_triangle(loop)
+        new_triangles.append(Triangle(*loop))
+
+    return new_triangles
+
+
+def fill_holes(bpa, max_hole_size):
+    """
+    Fill the holes of the mesh, from the smallest to the largest. Only the points of the holes boundaries are
+    touched, so the cost depends on the total size of the holes and not on the size of the cloud.
+
+    :param bpa: The BPA object with the mesh.
+    :param max_hole_size: Maximal number of edges of a hole to fill.
+    :return: List of the new triangles, and number of the holes that were not filled completely.
+    """
+    loops = [loop for loop in find_boundary_loops(bpa) if len(loop) <= max_hole_size]
+    loops.sort(key=lambda loop: calc_loop_perimeter(bpa, loop))
+
+    new_triangles = []
+    num_unfilled = 0
+
+    for loop in loops:
+        triangles = fill_hole(bpa, loop)
+        new_triangles.extend(triangles)
+
+        # A loop of n points is filled by n - 2 triangles.
+        if len(triangles) < len(loop) - 2:
+            num_unfilled += 1
+
+    return new_triangles, num_unfilled
+
+
+def unique_triangles(bpa):
+    """
+    Find the triangles of the mesh, each one once.
+
+    :param bpa: The BPA object with the mesh.
+    :return: Array of the triangles, as rows of 3 point ids, in the order they were made.
+    """
+    triangles = np.array(bpa.grid.triangles, dtype=np.int64).reshape(-1, 3)
+    _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+    return triangles[np.sort(first)]
+
+
+def mesh_radii(bpa, radii, limit=np.inf, max_hole_size=0, time_budget=None, cancel=None, on_triangles=None,
+               batch_size=MESH_BATCH_SIZE, checkpoint_path=None, first_pass=0, verbose=False):
+    """
+    Mesh with balls of growing radii, and then fill the holes. The mesh is kept between the radii: each larger ball
+    only pivots from the open edges the smaller balls left, and seeds from the unused points. The holes are not
+    filled if meshing stopped early.
+
+    :param bpa: The BPA object, with the radius of the first pass to run.
+    :param radii: List of the radii, in the order to use them.
+    :param limit: Maximal number of iterations for each radius.
+    :param max_hole_size: Maximal number of edges of the holes to fill after the last radius, 0 to not fill holes.
+    :param time_budget: Number of seconds for all the radii, or None.
+    :param cancel: Object with an is_set() method that stops meshing once it is set, or None (see BPA.iter_mesh).
+    :param on_triangles: Function called with each batch of new triangles, as an array of rows of 3 point ids, or
+    None.
+    :param batch_size: Maximal number of triangles in a batch.
+    :param checkpoint_path: Path of a checkpoint file, or None. The run is checkpointed after each radius, and
+    periodically during it.
+    :param first_pass: Index of the first radius to run, such as after resuming from a checkpoint.
+    :param verbose: Whether to print the running time of each radius.
+    :return: How the run ended ("done", "timed out" or "cancelled"), dictionary of the seconds each phase took:
+    "mesh_<radius>" for each radius and "holes", and number of the holes up to max_hole_size that were not filled
+    completely.
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    times = {}
+
+    def remaining_time():
+        return None if deadline is None else max(deadline - time.perf_counter(), 0)
+
     for i, radius in enumerate(radii):
-        start = time.time()
-        if not isinstance(input_path, str):
-            raise TypeError(f"Invalid path type: expected str, got {type(input_path)}")
-        bpa = BPA(path= input_path, radius=radius)
-        new_triangles = bpa.generate_mesh(limit_iterations=limit)#16600
-        end = time.time()
-
-        print(f"Radius of pivoting ball (iteration {i+1}): {radius}")
-        print(f"Running time: {end - start:.2f} seconds")
-        
-        # Insert unique triangles
-        for triangle in new_triangles:
-            triangle_tuple = triangle_to_tuple(triangle)
-            if triangle_tuple not in combined_triangles:
-                combined_triangles.add(triangle_tuple)
-    return combined_triangles
\ No newline at end of file
+        if i < first_pass:
+            continue
+
+        start = time.perf_counter()
+
+        if i > first_pass or bpa.radius != radius:
+            # A checkpoint taken during this radius continues with the front it saved.
+            bpa.set_radius(radius)
+
+        bpa.checkpoint_info["completed_passes"] = i
+
+        for batch in bpa.iter_mesh(limit_iterations=limit, time_budget=remaining_time(), cancel=cancel,
+                                   batch_size=batch_size, checkpoint_path=checkpoint_path):
+            if on_triangles is not None:
+                on_triangles(batch)
+
+        times[f"mesh_{radius:g}"] = time.perf_counter() - start
+
+        if verbose:
+            print(f"Radius of pivoting ball (iteration {i+1}): {radius}")
+            print(f"Running time: {times[f'mesh_{radius:g}']:.2f} seconds")
+
+        if BPA.is_stopped(deadline, cancel):
+            return "cancelled" if cancel is not None and cancel.is_set() else "timed out", times, 0
+
+        if checkpoint_path is not None:
+            bpa.checkpoint_info["completed_passes"] = i + 1
+            bpa.save_checkpoint(checkpoint_path)
+
+    num_unfilled_holes = 0
+
+    if max_hole_size > 0:
+        start = time.perf_counter()
+        new_triangles, num_unfilled_holes = fill_holes(bpa, max_hole_size)
+        triangles = np.array([triangle.vertices for triangle in new_triangles], dtype=np.int64).reshape(-1, 3)
+
+        if on_triangles is not None and len(triangles) > 0:
+            on_triangles(triangles)
+
+        times["holes"] = time.perf_counter() - start
+
+        if verbose:
+            print(f"Filled holes with {len(triangles)} triangles, {num_unfilled_holes} holes not filled completely")
+
+    return "done", times, num_unfilled_holes
+
+
+def Multiple_Pass(radii,input_path,limit,max_hole_size=0,checkpoint_path=None):
+    """
+    Mesh a point cloud with balls of growing radii, see mesh_radii. The cloud is read once.
+
+    :param radii: List of the radii, in the order to use them.
+    :param input_path: Path of the point cloud file.
+    :param limit: Maximal number of iterations for each radius.
+    :param max_hole_size: Maximal number of edges of the holes to fill after the last radius, 0 to not fill holes.
+    :param checkpoint_path: Path of a checkpoint file, or None. The run is checkpointed after each radius (and
+    periodically during it, see BPA.iter_mesh), and if the file exists, the run resumes from it instead of starting
+    over.
+    :return: The point cloud, and list of the unique triangles of the mesh.
+    """
+    if not isinstance(input_path, str):
+        raise TypeError(f"Invalid path type: expected str, got {type(input_path)}")
+
+    bpa = BPA(path=input_path, radius=radii[0])
+    first_pass = 0
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        bpa.load_checkpoint(checkpoint_path)
+        first_pass = bpa.checkpoint_info.get("completed_passes", 0)
+        print(f"Resuming from {checkpoint_path}, after {first_pass} completed radii")
+
+    #In this section the hole filling algorithm is implemeted
+    mesh_radii(bpa, radii, limit, max_hole_size=max_hole_size, checkpoint_path=checkpoint_path, first_pass=first_pass,
+               verbose=True)
+
+    return bpa.points, [Triangle(*triangle) for triangle in unique_triangles(bpa).tolist()]
@@ -1,17 +1,29 @@
+# States of an edge on the advancing front.
+ACTIVE = "active"  # Waiting on the front to be expanded.
+BOUNDARY = "boundary"  # Was tried, and the ball could not pivot around it.
+FROZEN = "frozen"  # Inside the mesh, in 2 triangles.
+
+
 class Edge:
+    __slots__ = ("p1", "p2", "state")
+
     def __init__(self, p1, p2):
         self.p1 = p1
         self.p2 = p2
-        self.num_triangles_this_edge_is_in = 0 # To avoid cases where algorithm tries to expand edges that are already
-        # part of 2 different triangles.
+        self.state = ACTIVE
         
 class Triangle:
+	__slots__ = ("v1", "v2", "v3")
+
 	def __init__(self, v1, v2, v3):
 		self.v1 = v1
 		self.v2 = v2
 		self.v3 = v3
-		self.vertices = [v1, v2, v3]
+
+	@property
+	def vertices(self):
+		return [self.v1, self.v2, self.v3]
 
 	def __eq__(self, other):
 		vertices = [self.v1, self.v2, self.v3]
-		return other.v1 in vertices and other.v2 in vertices and other.v3 in vertices
\ No newline at end of file
+		return other.v1 in vertices and other.v2 in vertices and other.v3 in vertices
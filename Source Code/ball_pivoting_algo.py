@@ -1,460 +1,1017 @@
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
 from typing import List
 import numpy as np
 from spatial_grid import Grid
-from point import Point
+from point import PointCloud
+from point_io import load_points
+from normal_estimation import estimate_normals
 import helper
-from Tracker import Edge, Triangle
+from Tracker import Edge, Triangle, ACTIVE, BOUNDARY, FROZEN
+from instrumentation import BPAStats
+import checkpoint
+
+# Number of free points the seed search takes at a time, per worker.
+SEED_BATCH_SIZE = 64
+
+# Number of point flags the seed search scans at a time, looking for free points.
+SEED_SCAN_SIZE = 4096
+
+# Default number of seconds between two checkpoints of a run (see BPA.iter_mesh).
+CHECKPOINT_INTERVAL = 600
+
+# Orders the advancing front can expand its edges in (see BPA.edge_priority).
+FRONT_PRIORITIES = ("insertion", "length", "angle")
+
+# Number of tiles the cloud is split to for each worker process, in parallel meshing. More tiles than workers keeps
+# the workers busy when some tiles take longer than others.
+TILES_PER_WORKER = 2
+
+# Seconds between two checks of the time budget and the cancel flag, while waiting for the tiles in parallel meshing.
+TILE_POLL_INTERVAL = 0.1
+
+
+def mesh_tile(shared_memory_name: str, num_points: int, radius: float, tile_range: tuple[float, float],
+              core_range: tuple[float, float], limit_iterations: int, time_budget: float = None) -> np.ndarray:
+    """
+    Mesh the points of one tile of the cloud, in a worker process. The tile is the points with an x coordinate in
+    tile_range, and only the triangles with all their points in core_range are kept. The rest of the tile makes sure
+    the triangles near the core's sides see all the points around them.
+
+    :param shared_memory_name: Name of the shared memory block with the cloud's coordinates and then its normals.
+    :param num_points: Number of points in the cloud.
+    :param radius: Radius of the ball.
+    :param tile_range: (min x, max x) of the tile's points.
+    :param core_range: (min x, max x) of the tile's core.
+    :param limit_iterations: Maximal number of iterations to mesh the tile with.
+    :param time_budget: Number of seconds the tile may take, from the call, or None.
+    :return: Array of the kept triangles, as rows of 3 point ids of the whole cloud.
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+
+    try:
+        arrays = np.ndarray((2, num_points, 3), dtype=np.float32, buffer=block.buf)
+        x = arrays[0, :, 0]
+        ids = np.flatnonzero((x >= tile_range[0]) & (x < tile_range[1]))
+        tile_points = PointCloud(arrays[0, ids], arrays[1, ids])
+    finally:
+        del arrays, x
+        block.close()
+
+    bpa = BPA(None, radius, points=tile_points)
+    bpa.generate_mesh(limit_iterations=limit_iterations,
+                      time_budget=None if deadline is None else max(deadline - time.perf_counter(), 0))
+
+    triangles = ids[np.array(bpa.grid.triangles, dtype=np.int64).reshape(-1, 3)]
+    triangles_x = tile_points.coordinates[np.searchsorted(ids, triangles), 0]
+    in_core = np.all((triangles_x >= core_range[0]) & (triangles_x < core_range[1]), axis=1)
+
+    return triangles[in_core]
+
+
+def fill_missing_normals(points: PointCloud, num_workers: int = 1) -> PointCloud:
+    """
+    Estimate the normals of the points without a normal (a zero normal), see normal_estimation.estimate_normals.
+
+    :param points: The point cloud. Its normals array is replaced if any normal is missing.
+    :param num_workers: Number of processes to estimate the normals with.
+    :return: The point cloud.
+    """
+    is_missing = ~np.any(points.normals != 0, axis=1)
+
+    if np.any(is_missing):
+        normals = estimate_normals(points.coordinates, num_workers=num_workers)
+
+        # Flip the estimated normals to agree with the given ones, if there are any.
+        is_given = ~is_missing
+        if np.any(is_given) and np.sum(np.einsum("ij,ij->i", normals[is_given], points.normals[is_given])) < 0:
+            normals *= -1
+
+        # Memory-mapped normals are read only, so the cloud gets a new array.
+        normals[is_given] = points.normals[is_given]
+        points.normals = normals
+
+    return points
 
 
 class BPA:
-    def __init__(self, path, radius, num_workers=1):
+    def __init__(self, path, radius, num_workers=1, use_cache=True, front_priority="insertion", points=None,
+                 grid=None):
+        if front_priority not in FRONT_PRIORITIES:
+            raise ValueError(f"Unknown front priority {front_priority!r}, expected one of {FRONT_PRIORITIES}.")
+
         self.first_free_point_index = 0
-        self.points = self.read_points(path)
-        self.num_triangles_this_edge_is_in=0
+        self.num_workers = num_workers
+        self.points = points if points is not None else self.read_points(path, use_cache=use_cache)
         self.radius = radius
-        self.grid = Grid(points=self.points, radius=radius)
+
+        # A grid can be given to skip building the cells, such as one made by Grid.copy_cells for these points.
+        self.grid = grid if grid is not None else Grid(points=self.points, radius=radius)
         self.num_free_points = len(self.points)
-        self.num_workers = num_workers
 
-    def read_points(self, path: str) -> List:
-        #Read the points from a text file.
-        points = []
-        f = open(path, "r")
-        lines = f.read().splitlines()
+        # Points that failed to start a seed triangle, and the threads that search seeds if num_workers > 1.
+        self.seed_rejected = np.zeros(len(self.points), dtype=bool)
+        self.seed_executor = None
 
-        for i, line in enumerate(lines):
-            coordinates = line.split()
+        # Advancing front: a heap of (priority, insertion counter, edge) of the open boundary edges.
+        # The priority is "insertion" (first in, first out), "length" (shortest edge first) or "angle" (smallest pivot
+        # angle first).
+        self.front = []
+        self.front_counter = 0
+        self.front_priority = front_priority
 
-            if len(coordinates) == 3:
-                p = Point(float(coordinates[0]), float(coordinates[1]), float(coordinates[2]), id=i)
-                points.append(p)
+        # Edges the ball failed to pivot around. Some of them might be closed later by other triangles.
+        self.boundary_edges = []
 
-            elif len(coordinates) == 6:
-                p = Point(float(coordinates[0]), float(coordinates[1]), float(coordinates[2]), id=i)
-                normal = [float(coordinates[3]), float(coordinates[4]), float(coordinates[5])]
-                p.normal = normal
-                points.append(p)
+        # Range (min x, max x) of the points new triangles can use, or None for all the points. Edges with a point
+        # within 2r of the max x are not pivoted, but put aside in deferred_edges, since the ball could hit points out
+        # of the range. Used to mesh the cloud slab by slab (see streaming.py).
+        self.x_range = None
+        self.deferred_edges = []
 
-            else:
-                continue
+        # Counters and timers of the run, or None if they are off (see enable_stats).
+        self.stats = None
 
-        f.close()
+        # Extra values saved with each checkpoint, such as the progress of a multi-pass run (see save_checkpoint).
+        self.checkpoint_info = {}
 
-        # Sorting the points can lead to better seed triangle picking
-        sorted_points = sorted(points, key=lambda p: (p.x, p.y, p.z))
+    def close(self):
+        """
+        Stop the threads of the seed search, if num_workers > 1. A later seed search starts them again.
+        """
+        if self.seed_executor is not None:
+            self.seed_executor.shutdown()
+            self.seed_executor = None
 
-        for i, p in enumerate(sorted_points):
-            p.id = i
+    def __enter__(self):
+        return self
 
-        return sorted_points
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    @staticmethod
-    def dist_between_point_and_edge(points: List, p1: Point, p2: Point) -> list:
-        
-        dists_p1 = [round(helper.calc_distance_points(p1, p3), 2) for p3 in points]
-        dists_p2 = [round(helper.calc_distance_points(p2, p3), 2) for p3 in points]
-        dists = [round(dists_p1[i] + dists_p2[i], 2) for i in range(len(dists_p1))]
-        return dists
+    def set_radius(self, radius: float):
+        """
+        Continue meshing with a ball of another radius. The points and the mesh are kept, only the grid's cells are
+        rebuilt, and the open edges of the mesh go back on the front, so the new ball pivots from them.
 
-    @staticmethod
-    def get_third_point_of_triangle(triangle_edges: List, p1: Point, p2: Point) -> Point:
+        :param radius: The new radius.
         """
-        Given a triangle's edges, and 2 of the points of the triangle, find the thirds point.
+        self.radius = radius
+        self.grid.set_radius(radius)
+
+        # Points that failed to start a seed triangle might start one with the new ball.
+        self.seed_rejected[:] = False
+        self.first_free_point_index = 0
+
+        self.front = []
+
+        for key in sorted(self.grid.edge_triangles):
+            if len(self.grid.edge_triangles[key]) == 1:
+                self.push_front(self.grid.get_edge(*key))
+
+    def enable_stats(self, profile: bool = False) -> BPAStats:
         """
-        triangle_points = []
-        third_point = None
+        Count and time the calls of the hot methods, the candidates they turn down and the size of the front. The
+        methods are wrapped on this instance only, so a BPA without stats runs the plain methods. Tiles meshed in
+        worker processes (see iter_mesh_parallel) are not counted.
 
-        for triangle_edge in triangle_edges:
-            first_point, second_point = triangle_edge.p1, triangle_edge.p2
-            triangle_points.append(first_point)
-            triangle_points.append(second_point)
+        :param profile: Whether to profile the seeding and expansion phases with cProfile as well.
+        :return: The stats, also kept in self.stats.
+        """
+        self.stats = BPAStats(profile=profile)
 
-        triangle_points = set(triangle_points)
+        for name, phase in (("find_seed_triangle", "seeding"), ("expand_triangle", "expansion"),
+                            ("find_closing_point", None), ("find_triangles_by_edge", None)):
+            setattr(self, name, self.stats.wrap(name, getattr(self, name), phase))
 
-        for point in triangle_points:
-            if point.id != p1.id and point.id != p2.id:
-                third_point = point
-                break
+        return self.stats
 
-        return third_point
+    def save_checkpoint(self, path: str):
+        """
+        Save the state of the run to a file, to resume it with load_checkpoint. See checkpoint.save_checkpoint.
 
-    @staticmethod
-    def will_triangles_overlap(edge: Edge, p3: Point, p4: Point) -> bool:
+        :param path: Path of the checkpoint file.
+        """
+        checkpoint.save_checkpoint(self, path, info=self.checkpoint_info)
+
+    def load_checkpoint(self, path: str):
+        """
+        Resume a run from a checkpoint file, saved for the same cloud. The mesh must be empty, and the ball gets the
+        radius of the checkpoint. Continue meshing with generate_mesh or iter_mesh.
+
+        :param path: Path of the checkpoint file.
+        """
+        self.checkpoint_info = checkpoint.load_checkpoint(self, path)
+
+    def read_points(self, path: str, use_cache: bool = True) -> PointCloud:
+        """
+        Read the points from a text, OBJ or binary file. Points without a normal (a zero normal) get an estimated one,
+        see fill_missing_normals.
+
+        :param path: Path of the point cloud file.
+        :param use_cache: Whether to load the cloud through the binary cache.
+        :return: The point cloud.
+        """
+        return fill_missing_normals(load_points(path, use_cache=use_cache), num_workers=self.num_workers)
+
+    def will_triangles_overlap(self, edge: Edge, p3: int, p4: int) -> bool:
         """
         Check if a triangle defined by the 2 points of "edge" and a point p3, will overlap  a triangle defined by
         2 points of "edge" and a point p4.
 
         :return: Boolean.
         """
-        p1, p2 = edge.p1, edge.p2
+        coordinates = self.points.coordinates
 
-        # The following section checks if p3 is the same side of the edge as the third point of the rectangle
-        # we are expanding. If so - keep searching, so we won't have overlapping triangles in the mesh.
-        # Calculate the normal of the triangle
-        v1 = [p3.x - p1.x, p3.y - p1.y, p3.z - p1.z]
-        v2 = [p2.x - p1.x, p2.y - p1.y, p2.z - p1.z]
-        triangle_normal = np.cross(v1, v2)
+        # Checks if p4 is the same side of the edge as p3. If so - keep searching, so we won't have overlapping
+        # triangles in the mesh.
+        return bool(helper.is_same_side_of_edge(coordinates[edge.p1], coordinates[edge.p2], coordinates[p3],
+                                                coordinates[p4]))
 
-        # Calculate the normal to the plane defined by v2 and the triangle_normal (the plane orthogonal to
-        # the triangle).
-        plane_normal = np.cross(v2, triangle_normal)
+    def rank_candidates(self, p1: int, p2: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        Evaluate all the candidate third points of a seed triangle on the edge p1-p2 at once, and keep the ones an
+        empty ball fits.
+
+        :param p1: First point of the edge.
+        :param p2: Second point of the edge.
+        :param candidates: Array of candidate point ids, all the points within 2r of both p1 and p2.
+        :return: Array of the ids of the surviving candidates, sorted by their distance from p1 and p2.
+        """
+        coordinates = self.points.coordinates
+        a, b = coordinates[p1], coordinates[p2]
+        c = coordinates[candidates]
 
-        # Check if p3 is in the same side of the plane as the third point.
-        v3 = [p4.x - p1.x, p4.y - p1.y, p4.z - p1.z]
+        dists = helper.calc_distance_points(a, c) + helper.calc_distance_points(b, c)
 
-        return np.sign(np.dot(plane_normal, v1)) == np.sign(np.dot(plane_normal, v3))
-    def find_triangles_by_edge(self, edge: Edge) -> List:
+        # Check that the ball fits the triangle. This also skips points that coincide with the edge's points.
+        centers, fits = helper.calc_ball_centers(a, b, c, self.radius)
+
+        # Check if the normal of the triangle is on the same direction with the point's normal.
+        agrees = np.cross(b - a, c - a) @ self.points.normals[p1] >= 0
+        mask = fits & agrees
+
+        # Check that no other point is inside the ball. Every such point would be a candidate as well.
+        centers, candidates, dists = centers[mask], candidates[mask], dists[mask]
+        dists_to_centers = np.linalg.norm(centers[:, None, :] - c[None, :, :], axis=2)
+        is_empty = ~np.any(dists_to_centers < self.radius * (1 - 1e-5), axis=1)
+
+        if self.stats is not None:
+            self.stats.reject("seed: ball does not fit", np.count_nonzero(~fits))
+            self.stats.reject("seed: normal disagrees", np.count_nonzero(fits & ~agrees))
+            self.stats.reject("seed: ball not empty", np.count_nonzero(~is_empty))
+
+        survivors = candidates[is_empty]
+        return survivors[np.argsort(dists[is_empty], kind="stable")]
+
+    def orient_edge(self, p1: int, p2: int, third_point: int) -> tuple[int, int]:
         """
-        Find all triangles the edge is in them.
+        Find the direction the triangle p1, p2, third_point goes over its edge p1-p2, when the triangle's normal agrees
+        with the normals of its points.
+
+        :return: The edge's points, in order.
         """
-        possible_triangles = []
+        coordinates, normals = self.points.coordinates, self.points.normals
+        triangle_normal = np.cross(coordinates[p2] - coordinates[p1], coordinates[third_point] - coordinates[p1])
 
-        for triangle in self.grid.triangles:
-            if edge.p1 in triangle and edge.p2 in triangle:
-                third_point = [p for p in triangle if p.id != edge.p1.id and p.id != edge.p2.id]
+        if triangle_normal @ (normals[p1] + normals[p2] + normals[third_point]) < 0:
+            return p2, p1
 
-                if len(third_point) > 0:
-                    third_point = third_point[0]
-                    possible_triangles.append([edge.p1, edge.p2, third_point])
+        return p1, p2
 
-        return possible_triangles
+    def pivot_candidates(self, p1: int, p2: int, third_point: int, candidates: np.ndarray) -> np.ndarray:
+        """
+        Pivot the ball of the triangle p1, p2, third_point around its edge p1-p2, and find the candidate points it hits,
+        for all the candidates at once.
+
+        :param p1: First point of the edge, in the order the triangle goes over it (see orient_edge).
+        :param p2: Second point of the edge.
+        :param third_point: Third point of the triangle the edge is already in.
+        :param candidates: Array of candidate point ids, all the points within 2r of both p1 and p2.
+        :return: Array of the ids of the candidates the ball can touch together with p1 and p2, in the order the
+        pivoting ball hits them.
+        """
+        coordinates, normals = self.points.coordinates, self.points.normals
+        a, b, o = coordinates[p1], coordinates[p2], coordinates[third_point]
+        c = coordinates[candidates]
 
-    def check_a_path_between_two_points(self, p1, p2, point_of_triangle_we_creating):
+        # The new triangle goes over the edge in the other direction: p2, p1, p3.
+        start_center, start_fits = helper.calc_ball_centers(a, b, o, self.radius)
+        centers, fits = helper.calc_ball_centers(b, a, c, self.radius)
+        fits &= (candidates != third_point)
+
+        # Candidates on the other triangle's side of the edge would make overlapping triangles.
+        other_side = ~helper.is_same_side_of_edge(a, b, o, c)
+
+        # Check if the normal of the new triangle is on the same direction with its points normals.
+        new_normals = np.cross(a - b, c - b)
+        agrees = np.sum(new_normals * (normals[candidates] + normals[p1] + normals[p2]), axis=1) >= 0
+        mask = fits & other_side & agrees
+
+        if self.stats is not None:
+            self.stats.reject("pivot: ball does not fit", np.count_nonzero(~fits))
+            self.stats.reject("pivot: same side as the edge's triangle", np.count_nonzero(fits & ~other_side))
+            self.stats.reject("pivot: normal disagrees", np.count_nonzero(fits & other_side & ~agrees))
+
+        if start_fits:
+            order = helper.calc_pivot_angles(a, b, start_center, centers)
+        else:
+            # The ball does not fit the starting triangle, which was made with a larger ball. Rank by distance.
+            order = helper.calc_distance_points(a, c) + helper.calc_distance_points(b, c)
+
+        survivors = candidates[mask]
+        return survivors[np.argsort(order[mask], kind="stable")]
+
+    def find_triangles_by_edge(self, edge: Edge) -> List:
+        """
+        Find all triangles the edge is in them.
         """
-        Check if there is a path between two gicen points.
+        return [[edge.p1, edge.p2, third_point_id]
+                for third_point_id in self.grid.get_edge_triangles(edge.p1, edge.p2)]
+
+    def find_closing_point(self, p1, p2, point_of_triangle_we_creating):
+        """
+        Find a point that is connected to both given points, other than the third point of the triangle we create.
 
         :param p1: First point we check.
         :param p2: Second point we check.
         :param point_of_triangle_we_creating: Third point of a triangle these 2 points are in.
-        :return:
+        :return: Id of the point, or None if there is no such point.
+        """
+        # Points connected to both p1 and p2 close a triangle with them.
+        intersection = self.grid.get_neighbors(p1) & self.grid.get_neighbors(p2)
+        intersection.discard(point_of_triangle_we_creating)
+
+        return min(intersection) if len(intersection) > 0 else None
+
+    def next_seed_points(self, start: int, count: int) -> np.ndarray:
         """
-        edges_first_point_int = []
-        edges_second_point_int = []
-        points_first_edges = []
-        points_second_edges = []
+        Find the next points that can start a seed triangle: points that are not used and did not fail to start one
+        before.
 
-        for e in self.grid.edges:
-            if p1.id == e.p1.id or p1.id == e.p2.id:
-                edges_first_point_int.append(e)
+        :param start: Id of the first point to look at.
+        :param count: Maximal number of points to find.
+        :return: Array of the points ids, in ascending order.
+        """
+        found = []
+        num_found = 0
 
-            if p2.id == e.p1.id or p2.id == e.p2.id:
-                edges_second_point_int.append(e)
+        # Scan the flags in blocks, so a call costs as much as the points it skips.
+        while start < len(self.points) and num_found < count:
+            end = min(start + SEED_SCAN_SIZE, len(self.points))
+            free = np.flatnonzero(~(self.points.is_used[start:end] | self.seed_rejected[start:end])) + start
+            found.append(free[:count - num_found])
+            num_found += len(found[-1])
+            start = end
 
-        for e in edges_first_point_int:
-            points_first_edges.append(e.p1.id)
-            points_first_edges.append(e.p2.id)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
 
-        for e in edges_second_point_int:
-            points_second_edges.append(e.p1.id)
-            points_second_edges.append(e.p2.id)
+    def filter_points_in_range(self, points: np.ndarray) -> np.ndarray:
+        """
+        Keep the points new triangles can use (see x_range).
 
-        points_first_edges = set(points_first_edges)
+        :param points: Array of point ids.
+        :return: Array of the ids of the points in the range.
+        """
+        if self.x_range is None:
+            return points
 
-        if p1.id in points_first_edges:
-            points_first_edges.remove(p1.id)
+        x = self.points.coordinates[points, 0]
+        return points[(x >= self.x_range[0]) & (x < self.x_range[1])]
 
-        points_second_edges = set(points_second_edges)
+    def find_seed_candidates(self, p1: int) -> List[tuple[int, int]]:
+        """
+        Find the triangles of unused points that an empty ball fits, and p1 can start a seed triangle with. Only reads
+        the mesh, so it can run for several points at once.
 
-        if p2.id in points_second_edges:
-            points_second_edges.remove(p2.id)
+        :param p1: First point of the seed triangle.
+        :return: List of (p2, p3) pairs, the best ones first.
+        """
+        coordinates = self.points.coordinates
 
-        intersection = set(points_first_edges & points_second_edges)
-        if point_of_triangle_we_creating.id in intersection:
-            intersection.remove(point_of_triangle_we_creating.id)
+        # Find all the unused points in 2r distance from p1, other than p1 itself.
+        p1_neighbor_points = self.grid.find_neighbor_points(p1)
+        is_free = ~self.points.is_used[p1_neighbor_points]
+        is_free &= np.any(coordinates[p1_neighbor_points] != coordinates[p1], axis=1)
+        p1_neighbor_points = self.filter_points_in_range(p1_neighbor_points[is_free])
 
-        return len(intersection) > 0
+        # Sort points by distance from p1, and reduce the neighbour points to 6.
+        dists = helper.calc_distance_points(coordinates[p1], coordinates[p1_neighbor_points])
+        point_limit = 6
+        p1_neighbor_points = p1_neighbor_points[np.argsort(dists, kind="stable")[:point_limit]]
 
+        seed_candidates = []
 
-    def find_seed_triangle(self, first_point_index=0, num_recursion_calls=0) -> tuple[int, tuple]:
-        """
-        Find seed triangle.
-        """
-        #Produces an error to break the iteration loop so that it doesn't iterate inifinitly
-        if num_recursion_calls > len(self.points):
-            return -1, -1, -1 
+        for p2 in p1_neighbor_points.tolist():
+            # Find all points that are on 2r distance from p1 and p2
+            possible_points = self.grid.find_common_neighbor_points(p1, p2)
 
-        if first_point_index >= len(self.points) - 1:
-            first_point_index = 0
+            # Keep the unused points that can form a valid triangle with p1 and p2, sorted by distance from them.
+            possible_points = self.rank_candidates(p1, p2, possible_points)
+            point_limit = 5 #limit the number of neighbour points to 5
+            possible_points = possible_points[~self.points.is_used[possible_points]]
+            possible_points = self.filter_points_in_range(possible_points)[:point_limit]
 
-        p1 = self.points[first_point_index] #get a point that is not used
-        p1_neighbor_points = []
+            seed_candidates.extend((p2, p3) for p3 in possible_points.tolist())
 
-        # Find all points in 2r distance from the point that was initially chosen.
-        for cell in p1.neighbor_nodes:
-            p1_neighbor_points.extend(self.grid.get_cell_points(cell))
+        return seed_candidates
 
-        p1_neighbor_points = set(p1_neighbor_points)
+    def add_seed_triangle(self, p1: int, p2: int, p3: int) -> tuple[Edge, Edge, Edge]:
+        """
+        Add a seed triangle to the mesh, if it fits the mesh's topology.
 
-        # Sort points by distance from p1.
-        dists = [helper.calc_distance_points(p1, p2) for p2 in p1_neighbor_points]
-        p1_neighbor_points = [x for _, x in sorted(zip(dists, p1_neighbor_points))]
-        #reduce the neighbour points to 6.
-        point_limit = 6
-        p1_neighbor_points = p1_neighbor_points[:point_limit]
+        :return: The triangle's edges, or None if the triangle was not added.
+        """
+        # The points might have been used since the triangle was found.
+        if self.points.is_used[[p1, p2, p3]].any():
+            if self.stats is not None:
+                self.stats.reject("seed: point used")
+            return None
 
-        # For each other point, find all points that are in 2r distance from that other point.
-        for p2 in p1_neighbor_points:
-            if p2.is_used:
-                pass
-            if p2.x == p1.x and p2.y == p1.y and p2.z == p1.z:
-                continue
+        # Check if two of the points are already connected.
+        if self.grid.get_edge(p1, p3) is not None or self.grid.get_edge(p1, p2) is not None or \
+                self.grid.get_edge(p2, p3) is not None:
+            if self.stats is not None:
+                self.stats.reject("seed: edge exists")
+            return None
 
-            # Find all points that are on 2r distance from p1 and p2
-            intersect_cells = list(set(p1.neighbor_nodes) & set(p2.neighbor_nodes))
-            possible_points = []
+        # Check if one of the new edges might close another triangle in the mesh.
+        p1_p3_closing_point = self.find_closing_point(p1, p3, point_of_triangle_we_creating=p2)
+        p2_p3_closing_point = self.find_closing_point(p2, p3, point_of_triangle_we_creating=p1)
+        p1_p2_closing_point = self.find_closing_point(p1, p2, point_of_triangle_we_creating=p3)
 
-            for cell in intersect_cells:
-                possible_points.extend(self.grid.get_cell_points(cell))
+        e1 = Edge(p1, p3)
 
-            # Sort points by distance from second point p2.
-            dists_p2 = [helper.calc_distance_points(p2, p3) for p3 in possible_points]
-            dist_p1 = [helper.calc_distance_points(p1, p3) for p3 in possible_points]
-            dists = [dist_p1[i] + dists_p2[i] for i in range(len(dist_p1))]
-            possible_points = [x for _, x in sorted(zip(dists, possible_points))] # put the possible points in the list
-            point_limit = 5 #limit the number of neighbour points to 5
-            possible_points = possible_points[:point_limit]
+        if p1_p3_closing_point is not None:
+            self.grid.add_edge_triangle(p1, p3, p1_p3_closing_point)
 
-            for _, p3 in enumerate(possible_points):
-                if p3.is_used:
-                    pass
+        e2 = Edge(p1, p2)
 
-                if (p3.x == p1.x and p3.y == p1.y and p3.z == p1.z) or (p2.x == p3.x and p2.y == p3.y and p2.z == p3.z):
-                    continue
+        if p1_p2_closing_point is not None:
+            self.grid.add_edge_triangle(p1, p2, p1_p2_closing_point)
+
+        e3 = Edge(p2, p3)
+
+        if p2_p3_closing_point is not None:
+            self.grid.add_edge_triangle(p2, p3, p2_p3_closing_point)
 
-                #checks the ball fits the triangle
-                if self.radius <= helper.calc_incircle_radius(p1, p2, p3):
-                    # Calculate triangle's normal.
-                    v1 = [p2.x - p1.x, p2.y - p1.y, p2.z - p1.z]
-                    v2 = [p3.x - p1.x, p3.y - p1.y, p3.z - p1.z]
-                    triangle_normal = np.cross(v1, v2)
+        self.grid.add_edge(e1)
+        self.grid.add_edge(e2)
+        self.grid.add_edge(e3)
 
-                    # Check if the normal of the triangle is on the same direction with points normals.
-                    if np.dot(triangle_normal, p1.normal) < 0:
-                        continue
+        self.grid.add_triangle([p1, p2, p3])
 
-                    # Check if two of the points are already connected.
-                    p1_p3_already_connected = [e for e in self.grid.edges if ((e.p1.id == p1.id) and (e.p2.id == p3.id)) or ((e.p1.id == p3.id) and (e.p2.id == p1.id))]
-                    p1_p2_already_connected = [e for e in self.grid.edges if ((e.p1.id == p1.id) and (e.p2.id == p2.id)) or ((e.p1.id == p2.id) and (e.p2.id == p1.id))]
-                    p2_p3_already_connected = [e for e in self.grid.edges if ((e.p1.id == p2.id) and (e.p2.id == p3.id)) or ((e.p1.id == p3.id) and (e.p2.id == p2.id))]
-                    e1,e2,e3 = None,None,None
-                    
-                    if len(p1_p3_already_connected) > 0 or len(p1_p2_already_connected) > 0 or len(p2_p3_already_connected) > 0:
-                        continue
+        # update the status of the seed triangle points so that they won't be used for another seed triangle.
+        self.points.is_used[[p1, p2, p3]] = True
 
-                    # Check if one of the new edges might close another triangle in the mesh.
-                    p1_p3_closing_another_triangle_in_the_mesh = self.check_a_path_between_two_points(p1, p3, point_of_triangle_we_creating=p2)
-                    p2_p3_closing_another_triangle_in_the_mesh = self.check_a_path_between_two_points(p2, p3, point_of_triangle_we_creating=p1)
-                    p1_p2_closing_another_triangle_in_the_mesh = self.check_a_path_between_two_points(p1, p2, point_of_triangle_we_creating=p3)
+        return e1, e2, e3
 
-                    if e1 is None:
-                        e1 = Edge(p1, p3)
-                        e1.num_triangles_this_edge_is_in += 1
+    def find_seed_triangle(self, first_point_index: int = None) -> tuple[int, tuple]:
+        """
+        Find seed triangle. The free points are walked in order from a cursor, and points that fail to start a seed
+        triangle are never tried again, since the mesh only grows.
+        If num_workers > 1, the candidates of a batch of free points are found in parallel threads.
+
+        :param first_point_index: Id of the point to start the search from. Defaults to the search cursor.
+        :return: (1, the seed triangle's edges, id of its first point), or (-1, -1, -1) if there are no more seeds.
+        """
+        if first_point_index is not None:
+            self.first_free_point_index = first_point_index
 
-                        if p1_p3_closing_another_triangle_in_the_mesh:
-                            e1.num_triangles_this_edge_is_in += 1
+        if self.num_workers > 1 and self.seed_executor is None:
+            self.seed_executor = ThreadPoolExecutor(max_workers=self.num_workers)
 
-                    if e2 is None:
-                        e2 = Edge(p1, p2)
-                        e2.num_triangles_this_edge_is_in += 1
+        batch_size = SEED_BATCH_SIZE * self.num_workers
 
-                        if p1_p2_closing_another_triangle_in_the_mesh:
-                            e2.num_triangles_this_edge_is_in += 1
+        while True:
+            batch = self.next_seed_points(self.first_free_point_index, batch_size)
 
-                    if e3 is None:
-                        e3 = Edge(p2, p3)
-                        e3.num_triangles_this_edge_is_in += 1
+            if len(batch) == 0:
+                self.first_free_point_index = len(self.points)
+                return -1, -1, -1
 
-                        if p2_p3_closing_another_triangle_in_the_mesh:
-                            e3.num_triangles_this_edge_is_in += 1
+            # All the points before the batch are used or rejected.
+            self.first_free_point_index = int(batch[0])
 
-                    self.grid.edges.append(e1)
-                    self.grid.edges.append(e2)
-                    self.grid.edges.append(e3)
+            # The built-in map finds the candidates lazily, one point at a time.
+            mapper = self.seed_executor.map if self.seed_executor is not None else map
 
-                    triangle = sorted(list({e1.p1, e1.p2, e2.p1, e2.p2, e3.p1, e3.p2}))
-                    self.grid.triangles.append(triangle)
+            for p1, seed_candidates in zip(batch.tolist(), mapper(self.find_seed_candidates, batch.tolist())):
+                if self.points.is_used[p1]:
+                    continue
 
-                    # Move the points to the end of the list.
-                    self.first_free_point_index += 1
-                    # update the status of the seed triangle points so that they won't be used for 
-                    p1.is_used = True
-                    p2.is_used = True
-                    p3.is_used = True
+                for p2, p3 in seed_candidates:
+                    edges = self.add_seed_triangle(p1, p2, p3)
 
-                    return 1, (e1, e2, e3), first_point_index
+                    if edges is not None:
+                        return 1, edges, p1
 
-        # Else, find another free point and start over.
-        return self.find_seed_triangle(first_point_index=first_point_index+1, num_recursion_calls=num_recursion_calls+1)
+                # Else, remember the point failed, and move to the next free point.
+                self.seed_rejected[p1] = True
 
-    def expand_triangle(self, edge: Edge, triangle_edges: List[Edge]) -> tuple[Edge, Edge]:
+    def expand_triangle(self, edge: Edge) -> tuple[Edge, Edge]:
         """
         Tuple of two edges of the new formed triangle.
         """
-        if edge.num_triangles_this_edge_is_in < 2:
-            # Avoid duplications.
-            intersect_cells = list(set(edge.p1.neighbor_nodes) & set(edge.p2.neighbor_nodes))
-            possible_points = []
+        edge_triangles = self.grid.get_edge_triangles(edge.p1, edge.p2)
 
+        if len(edge_triangles) == 1:
             p1, p2 = edge.p1, edge.p2
-            third_point_of_triangle_for_expantion = self.get_third_point_of_triangle(triangle_edges, p1, p2)
 
-            for cell in intersect_cells:
-                possible_points.extend(self.grid.get_cell_points(cell))
+            third_point_of_triangle_for_expantion = edge_triangles[0]
+            possible_points = self.filter_points_in_range(self.grid.find_common_neighbor_points(p1, p2))
 
-            # Sort points by distance from p1 and p2.
-            dists = self.dist_between_point_and_edge(possible_points, p1, p2)
-            sorted_possible_points = [x for _, x in sorted(zip(dists, possible_points))]
+            # Pivot the ball around the edge, in the direction the triangle it is in goes over it.
+            p1, p2 = self.orient_edge(p1, p2, third_point_of_triangle_for_expantion)
             point_limit = 5
+            sorted_possible_points = self.pivot_candidates(p1, p2, third_point_of_triangle_for_expantion,
+                                                           possible_points)
+
+            if self.stats is not None:
+                self.stats.reject("expand: past the point limit", max(len(sorted_possible_points) - point_limit, 0))
+
             sorted_possible_points = sorted_possible_points[:point_limit]
 
-            for _, p3 in enumerate(sorted_possible_points):
-                if p3.id == p1.id or p3.id == p2.id or p3.id == third_point_of_triangle_for_expantion.id:
-                    continue
+            for p3 in sorted_possible_points.tolist():
+                # Find the single edges the points are already connected with, if any.
+                e1 = self.grid.get_edge(p1, p3)
+                e2 = self.grid.get_edge(p2, p3)
+
+                # If both edges exist, the new triangle fills a hole of 3 edges, such as where two fronts meet. The checks
+                # below make sure it fits the triangles of both edges.
+                if e1 is not None:
+                    # Make sure that if the edge they are already connected with is part of the triangle, the new
+                    # triangle will not overlap
+                    triangles = self.find_triangles_by_edge(e1)
+
+                    if len(triangles) >= 2:
+                        # The ball hit a point of the mesh that is closed on this side. The points further along were
+                        # only hit after it, so a triangle with them would lie over the mesh: the edge is a boundary.
+                        if self.stats is not None:
+                            self.stats.reject("expand: edge in 2 triangles")
+                        return None, None
+                    else:
+                        third_point_of_triangle = triangles[0][2]
+
+                        if self.will_triangles_overlap(e1, third_point_of_triangle, p2):
+                            if self.stats is not None:
+                                self.stats.reject("expand: triangles overlap")
+                            continue
 
-                if self.will_triangles_overlap(edge, third_point_of_triangle_for_expantion, p3):
-                    continue
+                if e2 is not None:
+                    # Make sure that if the edge they are already connected with is part of the triangle, the new
+                    # triangle will not overlap
+                    triangles = self.find_triangles_by_edge(e2)
+
+                    if len(triangles) >= 2:
+                        # See e1.
+                        if self.stats is not None:
+                            self.stats.reject("expand: edge in 2 triangles")
+                        return None, None
+                    else:
+                        third_point_of_triangle = triangles[0][2]
+
+                        if self.will_triangles_overlap(e2, third_point_of_triangle, p1):
+                            if self.stats is not None:
+                                self.stats.reject("expand: triangles overlap")
+                            continue
 
-                
-                t = helper.calc_incircle_radius(p1, p2, p3)
-                if self.radius <= t:
-                    # Calculate new triangle's normal.
-                    v1 = [p2.x - p1.x, p2.y - p1.y, p2.z - p1.z]
-                    v2 = [p3.x - p1.x, p3.y - p1.y, p3.z - p1.z]
-                    new_triangle_normal = np.cross(v1, v2)
+                # Check if one of the new edges might close another triangle in the mesh.
+                p1_p3_closing_point = None
+                p2_p3_closing_point = None
 
-                    # Check if the normal of the triangle is on the same direction with other points normals.
-                    if np.dot(new_triangle_normal, p1.normal) < 0 and np.dot(new_triangle_normal, p2.normal) < 0:
-                        pass
+                if self.points.is_used[p3]:
+                    p1_p3_closing_point = self.find_closing_point(p1, p3, p2)
+                    p2_p3_closing_point = self.find_closing_point(p2, p3, p1)
 
-                    e1 = None
-                    e2 = None
+                # If Update that 'point' is not free anymore, we update the point status to True .
+                self.points.is_used[p3] = True
 
-                    p1_and_p3_already_connected = [e for e in self.grid.edges if ((e.p1.id == p1.id) and (e.p2.id == p3.id)) or ((e.p1.id == p3.id) and (e.p2.id == p1.id))]
-                    p2_and_p3_already_connected = [e for e in self.grid.edges if ((e.p1.id == p2.id) and (e.p2.id == p3.id)) or ((e.p1.id == p3.id) and (e.p2.id == p2.id))]
+                if e1 is None:
+                    e1 = Edge(p1, p3)
 
-                    # These points are already part of a triangle!
-                    if len(p1_and_p3_already_connected) and len(p2_and_p3_already_connected):
-                        continue
+                    if p1_p3_closing_point is not None:
+                        self.grid.add_edge_triangle(p1, p3, p1_p3_closing_point)
 
-                    if len(p1_and_p3_already_connected) > 0:
-                        # Find the single edge they are connected with.
-                        e1 = p1_and_p3_already_connected[0]
+                if e2 is None:
+                    e2 = Edge(p2, p3)
 
-                        if e1.num_triangles_this_edge_is_in >= 2:
-                            continue
+                    if p2_p3_closing_point is not None:
+                        self.grid.add_edge_triangle(p2, p3, p2_p3_closing_point)
 
-                        # Make sure that if the edge they are already connected with is part of the triangle, the new
-                        # triangle will not overlap
-                        triangles = self.find_triangles_by_edge(e1)
+                self.grid.add_edge(e1)
+                self.grid.add_edge(e2)
 
-                        if len(triangles) >= 2:
-                            continue
-                        else:
-                            third_point_of_triangle = [p for p in triangles[0] if p.id != p1.id and p.id != p3.id][0]
+                # The new triangle goes over the edge in the other direction, to keep the orientation consistent.
+                self.grid.add_triangle([p2, p1, p3])
+                return e1, e2
+            else:
+                return None, None
 
-                            if self.will_triangles_overlap(e1, third_point_of_triangle, p2):
-                                continue
+        return None, None
 
-                        e1.num_triangles_this_edge_is_in += 1
+    def edge_priority(self, edge: Edge) -> float:
+        """
+        Find the priority of an edge on the front. Edges with lower priority are expanded first.
+        """
+        if self.front_priority == "length":
+            return float(helper.calc_distance_points(self.points.coordinates[edge.p1], self.points.coordinates[edge.p2]))
 
-                    if len(p2_and_p3_already_connected) > 0:
-                        # Find the single edge they are connected with.
-                        e2 = p2_and_p3_already_connected[0]
+        elif self.front_priority == "angle":
+            # The angle the ball pivots around the edge before it hits a point.
+            edge_triangles = self.grid.get_edge_triangles(edge.p1, edge.p2)
 
-                        if e2.num_triangles_this_edge_is_in >= 2:
-                            continue
+            if len(edge_triangles) != 1:
+                return np.inf
 
-                        # Make sure that if the edge they are already connected with is part of the triangle, the new
-                        # triangle will not overlap
-                        triangles = self.find_triangles_by_edge(e2)
+            p1, p2 = self.orient_edge(edge.p1, edge.p2, edge_triangles[0])
+            candidates = self.filter_points_in_range(self.grid.find_common_neighbor_points(p1, p2))
+            candidates = self.pivot_candidates(p1, p2, edge_triangles[0], candidates)
 
-                        if len(triangles) >= 2:
-                            continue
-                        else:
-                            third_point_of_triangle = [p for p in triangles[0] if p.id != p1.id and p.id != p3.id][0]
-                            if self.will_triangles_overlap(e2, third_point_of_triangle, p1):
-                                continue
+            if len(candidates) == 0:
+                return np.inf
 
-                        e2.num_triangles_this_edge_is_in += 1
+            coordinates = self.points.coordinates
+            start_center, _ = helper.calc_ball_centers(coordinates[p1], coordinates[p2],
+                                                       coordinates[edge_triangles[0]], self.radius)
+            center, _ = helper.calc_ball_centers(coordinates[p2], coordinates[p1], coordinates[candidates[0]],
+                                                 self.radius)
+            return float(helper.calc_pivot_angles(coordinates[p1], coordinates[p2], start_center, center))
 
-                    # Check if one of the new edges might close another triangle in the mesh.
-                    p1_p3_closing_another_triangle_in_the_mesh = False
-                    p2_p3_closing_another_triangle_in_the_mesh = False
+        # Insertion order.
+        return 0.0
 
-                    if p3.is_used:
-                        p1_p3_closing_another_triangle_in_the_mesh = self.check_a_path_between_two_points(p1, p3, p2)
-                        p2_p3_closing_another_triangle_in_the_mesh = self.check_a_path_between_two_points(p2, p3, p1)
+    def freeze_edge(self, edge: Edge):
+        """
+        Take an edge that is in 2 triangles off the front. If one of them is only a closed path of edges, the edge is
+        still open in the mesh, and is kept as a boundary edge.
+        """
+        if len(self.grid.get_edge_faces(edge.p1, edge.p2)) == 1:
+            edge.state = BOUNDARY
+            self.boundary_edges.append(edge)
+        else:
+            edge.state = FROZEN
 
-                    # Update that the edge that is expanded is now part of the triangle.
-                    edge.num_triangles_this_edge_is_in += 1
+    def push_front(self, edge: Edge):
+        """
+        Add an edge to the advancing front, unless it is already in 2 triangles.
+        """
+        if len(self.grid.get_edge_triangles(edge.p1, edge.p2)) >= 2:
+            self.freeze_edge(edge)
+            return
 
-                    # If Update that 'point' is not free anymore, we update the point status to True .
-                    p3.is_used = True
+        edge.state = ACTIVE
+        heapq.heappush(self.front, (self.edge_priority(edge), self.front_counter, edge))
+        self.front_counter += 1
 
-                    if e1 is None:
-                        e1 = Edge(p1, p3)
-                        e1.num_triangles_this_edge_is_in += 1
+    def pop_front(self) -> Edge:
+        """
+        Take the next active edge off the advancing front.
 
-                        if p1_p3_closing_another_triangle_in_the_mesh:
-                            e1.num_triangles_this_edge_is_in += 1
+        :return: The edge, or None if the front is empty.
+        """
+        while self.front:
+            _, _, edge = heapq.heappop(self.front)
 
-                    if e2 is None:
-                        e2 = Edge(p2, p3)
-                        e2.num_triangles_this_edge_is_in += 1
+            if edge.state != ACTIVE:
+                continue
 
-                        if p2_p3_closing_another_triangle_in_the_mesh:
-                            e2.num_triangles_this_edge_is_in += 1
+            if len(self.grid.get_edge_triangles(edge.p1, edge.p2)) >= 2:
+                self.freeze_edge(edge)
+                continue
 
-                    self.grid.add_edge(e1)
-                    self.grid.add_edge(e2)
+            if self.x_range is not None and \
+                    self.points.coordinates[[edge.p1, edge.p2], 0].max() >= self.x_range[1] - 2 * self.radius:
+                self.deferred_edges.append(edge)
+                continue
 
-                    triangle = sorted(list({e1.p1, e1.p2, e2.p1, e2.p2,edge.p1, edge.p2}))
+            return edge
 
-                    v1 = [p2.x - p1.x, p2.y - p1.y, p2.z - p1.z]
-                    v2 = [p3.x - p1.x, p3.y - p1.y, p3.z - p1.z]
-                    normal = np.cross(v1, v2)
+        return None
 
-                    if np.sign(np.dot(normal, p1.normal)) < 0:
-                        triangle.reverse() #reverse the orientation
+    def find_open_edges(self) -> List[Edge]:
+        """
+        Find the edges of the mesh that are in a single triangle, from the boundary edges and the front, without
+        scanning the whole mesh.
 
-                    self.grid.triangles.append(triangle)
-                    return e1, e2
-            else:
-                return None, None
+        :return: List of the open edges.
+        """
+        open_edges = {}
 
-        return None, None
+        for edge in self.boundary_edges + [front_edge for _, _, front_edge in self.front]:
+            if len(self.grid.get_edge_faces(edge.p1, edge.p2)) == 1:
+                open_edges[self.grid.edge_key(edge.p1, edge.p2)] = edge
+
+        self.boundary_edges = list(open_edges.values())
+        return self.boundary_edges
+
+    def generate_mesh(self, limit_iterations: int = np.inf,first_point_index: int = None, time_budget: float = None,
+                      cancel=None, checkpoint_path: str = None, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        """
+        Mesh the cloud. See iter_mesh.
+
+        :return: List of the new triangles.
+        """
+        return list(self.iter_mesh(limit_iterations=limit_iterations, first_point_index=first_point_index,
+                                   time_budget=time_budget, cancel=cancel, checkpoint_path=checkpoint_path,
+                                   checkpoint_interval=checkpoint_interval))
+
+    def iter_mesh(self, limit_iterations: int = np.inf, first_point_index: int = None, time_budget: float = None,
+                  cancel=None, batch_size: int = 0, checkpoint_path: str = None,
+                  checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        """
+        Mesh the cloud, and yield the triangles as they are made. The caller can stop meshing at any time by not
+        asking for more triangles; the mesh made so far stays in the grid.
+        If num_workers > 1 and the mesh is empty, the cloud is meshed in parallel tiles (see iter_mesh_parallel).
+
+        :param limit_iterations: Maximal number of seeds and expansions.
+        :param first_point_index: Id of the point to start the seed search from. Defaults to the search cursor.
+        :param time_budget: Number of seconds to mesh for, or None to mesh until done.
+        :param cancel: Object with an is_set() method, such as a threading.Event, that stops meshing once it is set.
+        :param batch_size: If > 0, yield arrays of up to batch_size rows of 3 point ids instead of Triangle objects.
+        :param checkpoint_path: Path to save a checkpoint to every checkpoint_interval seconds and when meshing stops,
+        or None. Parallel tiles are not checkpointed, only the seeding and expansion that follow them.
+        :param checkpoint_interval: Number of seconds between two checkpoints.
+        :return: Generator of the new triangles.
+        """
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+        if self.num_workers > 1 and len(self.grid.triangles) == 0:
+            triangles = self.iter_mesh_parallel(limit_iterations=limit_iterations, deadline=deadline, cancel=cancel,
+                                                checkpoint_path=checkpoint_path,
+                                                checkpoint_interval=checkpoint_interval)
+        else:
+            triangles = self.iter_front(limit_iterations=limit_iterations, first_point_index=first_point_index,
+                                        deadline=deadline, cancel=cancel, checkpoint_path=checkpoint_path,
+                                        checkpoint_interval=checkpoint_interval)
 
-    def generate_mesh(self, limit_iterations: int = np.inf,first_point_index: int = 0):
+        if batch_size <= 0:
+            yield from triangles
+            return
+
+        batch = []
+
+        for triangle in triangles:
+            batch.append(triangle.vertices)
+
+            if len(batch) == batch_size:
+                yield np.array(batch, dtype=np.int64)
+                batch = []
+
+        if batch:
+            yield np.array(batch, dtype=np.int64)
+
+    @staticmethod
+    def is_stopped(deadline: float, cancel) -> bool:
+        """
+        Check if meshing should stop, because the time is up or it was cancelled.
+
+        :param deadline: time.perf_counter() value to stop at, or None.
+        :param cancel: Object with an is_set() method, or None.
+        :return: Boolean.
+        """
+        return (deadline is not None and time.perf_counter() >= deadline) or (cancel is not None and cancel.is_set())
+
+    def add_triangles(self, triangles: np.ndarray):
+        """
+        Add triangles to the mesh, with their edges, and mark their points as used.
+
+        :param triangles: Array of triangles, as rows of 3 point ids, in the order they go over their edges.
+        """
+        for p1, p2, p3 in triangles.tolist():
+            for a, b in ((p1, p2), (p2, p3), (p3, p1)):
+                if self.grid.get_edge(a, b) is None:
+                    self.grid.add_edge(Edge(a, b))
+
+            self.grid.add_triangle([p1, p2, p3])
+
+        self.points.is_used[triangles.ravel()] = True
+
+    def find_tiles(self) -> tuple[np.ndarray, float]:
+        """
+        Split the cloud to tiles along the x axis, with about the same number of points in each. Tiles that are too
+        narrow for their triangles to be meshed on their own are merged.
+
+        :return: Array of the x coordinates of the seams between the tiles, and the width of the band around each seam
+        that is meshed after the tiles.
+        """
+        # Triangles that cross a seam are dropped, and their points are within 2r of it. Seeds 2r further away can
+        # use these points again, so the band covers both.
+        band = 4 * self.radius
+        x = np.sort(self.points.coordinates[:, 0])
+
+        for num_tiles in range(self.num_workers * TILES_PER_WORKER, 1, -1):
+            seams = x[(np.arange(1, num_tiles) * len(x)) // num_tiles]
+
+            # Every tile must be wider than the bands around its seams.
+            widths = np.diff(np.concatenate(([x[0]], seams, [x[-1]])))
+
+            if np.all(widths > 2 * band):
+                return seams, band
+
+        return np.empty(0), band
+
+    def iter_mesh_parallel(self, limit_iterations: int = np.inf, deadline: float = None, cancel=None,
+                           checkpoint_path: str = None, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        """
+        Mesh the cloud in parallel. The cloud is split to tiles along the x axis, and each tile is meshed on its own by
+        a worker process, which reads the points from shared memory. The triangles that cross a seam between two
+        tiles are dropped, and the bands around the seams are then meshed again by pivoting from the tiles' open edges,
+        which stitches the tiles to one mesh.
+
+        :param limit_iterations: Maximal number of iterations, for each tile and for the stitching.
+        :param deadline: time.perf_counter() value to stop at, or None.
+        :param cancel: Object with an is_set() method that stops meshing once it is set, or None.
+        :param checkpoint_path: Path to checkpoint the stitching to, or None (see iter_front).
+        :param checkpoint_interval: Number of seconds between two checkpoints.
+        :return: Generator of the triangles, tile by tile and then the seams.
+        """
+        seams, band = self.find_tiles()
+
+        if len(seams) == 0:
+            yield from self.iter_front(limit_iterations=limit_iterations, deadline=deadline, cancel=cancel,
+                                       checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval)
+            return
+
+        # Share the points with the workers.
+        num_points = len(self.points)
+        block = shared_memory.SharedMemory(create=True, size=max(2 * num_points * 3 * 4, 1))
+        executor = ProcessPoolExecutor(max_workers=self.num_workers)
+
+        try:
+            arrays = np.ndarray((2, num_points, 3), dtype=np.float32, buffer=block.buf)
+            arrays[0] = self.points.coordinates
+            arrays[1] = self.points.normals
+            del arrays
+
+            bounds = np.concatenate(([-np.inf], seams, [np.inf]))
+            margin = 2 * self.radius
+
+            # Each tile gets the budget left now, less one poll interval to hand its triangles back before the
+            # deadline. Tiles still queued at the deadline are cancelled once the wait below stops.
+            time_budget = None if deadline is None else max(deadline - time.perf_counter() - TILE_POLL_INTERVAL, 0)
+            futures = [executor.submit(mesh_tile, block.name, num_points, self.radius,
+                                       (bounds[i] - margin, bounds[i + 1] + margin), (bounds[i], bounds[i + 1]),
+                                       limit_iterations, time_budget)
+                       for i in range(len(bounds) - 1)]
+
+            # Take the tiles in order, so the stitching does not depend on which worker finishes first.
+            for future in futures:
+                while not wait([future], timeout=TILE_POLL_INTERVAL).done and not self.is_stopped(deadline, cancel):
+                    pass
+
+                if not future.done():
+                    return
+
+                triangles = future.result()
+                self.add_triangles(triangles)
+                yield from (Triangle(*triangle) for triangle in triangles.tolist())
+
+                if self.is_stopped(deadline, cancel):
+                    return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            block.close()
+            block.unlink()
+
+        # Points away from the seams already failed to start a seed triangle in their tile, with the same points
+        # around them free.
+        x = self.points.coordinates[:, 0]
+        seam_distances = np.abs(x[:, None] - seams[None, :]).min(axis=1)
+        is_near_seam = seam_distances <= band
+        self.seed_rejected |= ~is_near_seam
+
+        # Pivot from the open edges near the seams. The other open edges already failed to pivot in their tile.
+        for edge in self.grid.edges.values():
+            if len(self.grid.get_edge_faces(edge.p1, edge.p2)) == 1:
+                if is_near_seam[edge.p1] or is_near_seam[edge.p2]:
+                    self.push_front(edge)
+                else:
+                    edge.state = BOUNDARY
+                    self.boundary_edges.append(edge)
+
+        yield from self.iter_front(limit_iterations=limit_iterations, deadline=deadline, cancel=cancel,
+                                   checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval)
+
+        if not self.is_stopped(deadline, cancel):
+            yield from self.fill_closed_paths(is_near_seam)
+
+    def fill_closed_paths(self, is_near_point: np.ndarray):
+        """
+        Add the triangles of closed paths of 3 edges that were recorded on their edges but not added to the mesh (see
+        find_closing_point), where they fit the triangles around them. Where two fronts meet, these are the triangles
+        left between them.
+
+        :param is_near_point: Boolean array, whether to fill the paths that go through each point.
+        :return: List of the new triangles.
+        """
+        # Edges the triangles go over, in their direction.
+        directed_edges = set()
+
+        for p1, p2, p3 in self.grid.triangles:
+            directed_edges.update(((p1, p2), (p2, p3), (p3, p1)))
+
+        closed_paths = set()
+
+        for (p1, p2), third_points in self.grid.edge_triangles.items():
+            for p3 in third_points:
+                if is_near_point[p1] or is_near_point[p2] or is_near_point[p3]:
+                    closed_paths.add(tuple(sorted((p1, p2, p3))))
+
+        new_triangles = []
+
+        for p1, p2, p3 in sorted(closed_paths):
+            path_edges = ((p1, p2, p3), (p2, p3, p1), (p1, p3, p2))
+
+            # Skip the triangles that are already in the mesh.
+            if p3 in self.grid.get_edge_faces(p1, p2):
+                continue
+
+            # Every edge must have room for the triangle.
+            if any(len(set(self.grid.get_edge_triangles(a, b)) | {c}) > 2 for a, b, c in path_edges):
+                continue
+
+            # The triangle goes over each edge in the other direction than the triangle already on it.
+            for triangle in ([p1, p2, p3], [p1, p3, p2]):
+                a, b, c = triangle
+                triangle_edges = ((a, b), (b, c), (c, a))
+
+                if not directed_edges.isdisjoint(triangle_edges) or \
+                        all((b, a) not in directed_edges for a, b in triangle_edges):
+                    continue
+
+                self.grid.add_triangle(triangle)
+                directed_edges.update(triangle_edges)
+                new_triangles.append(Triangle(*triangle))
+                break
+
+        return new_triangles
+
+    def iter_front(self, limit_iterations: int = np.inf, first_point_index: int = None, deadline: float = None,
+                   cancel=None, checkpoint_path: str = None, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        """
+        Grow the mesh from the advancing front, and find a new seed triangle whenever the front is empty.
+
+        :param limit_iterations: Maximal number of seeds and expansions.
+        :param first_point_index: Id of the point to start the seed search from. Defaults to the search cursor.
+        :param deadline: time.perf_counter() value to stop at, or None.
+        :param cancel: Object with an is_set() method that stops meshing once it is set, or None.
+        :param checkpoint_path: Path to save a checkpoint to every checkpoint_interval seconds and when meshing ends or
+        is stopped by the limit, time budget or cancel, or None. Checkpoints are only taken between iterations, when the mesh and the front agree.
+        :param checkpoint_interval: Number of seconds between two checkpoints.
+        :return: Generator of the new triangles.
+        """
         expansion_counter = 0
-        facets = []
+        last_checkpoint = time.perf_counter()
+
+        if first_point_index is not None:
+            self.first_free_point_index = first_point_index
+
+        try:
+            while expansion_counter < limit_iterations and not self.is_stopped(deadline, cancel):
+                if self.stats is not None:
+                    self.stats.sample_front(expansion_counter, len(self.front))
 
-        while 1 and expansion_counter < limit_iterations:
-            # Find a seed triangle.
-            _, edges, last_point_index = self.find_seed_triangle(first_point_index=first_point_index)
-            first_point_index = last_point_index
+                if checkpoint_path is not None and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                    self.save_checkpoint(checkpoint_path)
+                    last_checkpoint = time.perf_counter()
 
-            if edges == None or edges == -1:
-                return facets
+                edge = self.pop_front()
 
+                if edge is None:
+                    # The front is empty. Find a seed triangle.
+                    _, edges, _ = self.find_seed_triangle()
 
-            expansion_counter += 1
-            i = 0
+                    if edges == None or edges == -1:
+                        break
 
-            # Try to expand from each edge.
-            while i < len(edges) and expansion_counter < limit_iterations:
-                e1, e2 = self.expand_triangle(edges[i], edges)
-                
+                    expansion_counter += 1
+
+                    for e in edges:
+                        self.push_front(e)
+
+                    yield Triangle(*self.grid.triangles[-1])
+                    continue
+
+                # Try to expand from the edge.
+                e1, e2 = self.expand_triangle(edge)
                 expansion_counter += 1
 
                 if e1 != None and e2 != None:
-                    edges = [e1, e2]
-                    mesh_triangle=Triangle(e1.p1,e1.p2,e2.p1)
-                    i = 0
-                    
-                    facets.append(mesh_triangle)
+                    edge.state = FROZEN
+                    self.push_front(e1)
+                    self.push_front(e2)
+                    yield Triangle(*self.grid.triangles[-1])
 
                 else:
-                    i += 1
-
-        return facets
-
+                    edge.state = BOUNDARY
+                    self.boundary_edges.append(edge)
+
+            if checkpoint_path is not None:
+                self.save_checkpoint(checkpoint_path)
+        finally:
+            # The seed threads are started again if meshing goes on.
+            self.close()
@@ -0,0 +1,255 @@
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import time
+import traceback
+from collections import deque
+import numpy as np
+from ball_pivoting_algo import BPA
+from Holefilling import mesh_radii, unique_triangles
+from instrumentation import get_peak_memory
+from mesh_io import write_mesh
+
+# Point cloud files a directory is scanned for.
+CLOUD_EXTENSIONS = (".txt", ".obj", ".bpc")
+
+# Seconds a job gets after its time limit to stop meshing and write what it made, before it is killed.
+KILL_GRACE_PERIOD = 30
+
+# Seconds the scheduler waits for a job to finish before it checks the time limits again.
+POLL_INTERVAL = 0.5
+
+
+def read_manifest(path: str, default_radii: list) -> list:
+    """
+    Read the jobs of a manifest file, with one cloud per line: its path and then the radii to mesh it with, as
+    "path [radius ...]". Lines without radii get the default radii, and empty lines and lines starting with # are
+    skipped. Relative paths are relative to the manifest's directory.
+
+    :param path: Path of the manifest file.
+    :param default_radii: Radii of the clouds without radii of their own.
+    :return: List of the jobs, as dictionaries with the cloud's "path" and "radii".
+    """
+    jobs = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            splitted = line.split()
+
+            if not splitted or splitted[0].startswith("#"):
+                continue
+
+            try:
+                radii = [float(value) for value in splitted[1:]] or default_radii
+            except ValueError:
+                raise ValueError(f"{path}:{line_number}: radii must be numbers, got {' '.join(splitted[1:])}")
+
+            jobs.append({"path": os.path.join(base_dir, splitted[0]), "radii": radii})
+
+    return jobs
+
+
+def find_jobs(input_path: str, default_radii: list) -> list:
+    """
+    Find the clouds to mesh: every cloud file of a directory, with the default radii, or the clouds of a manifest
+    file (see read_manifest).
+
+    :param input_path: Path of the directory or manifest file.
+    :param default_radii: Radii of the clouds without radii of their own.
+    :return: List of the jobs, as dictionaries with the cloud's "path" and "radii".
+    """
+    if os.path.isdir(input_path):
+        return [{"path": os.path.join(input_path, name), "radii": default_radii}
+                for name in sorted(os.listdir(input_path))
+                if os.path.splitext(name)[1].lower() in CLOUD_EXTENSIONS]
+
+    return read_manifest(input_path, default_radii)
+
+
+def name_jobs(jobs: list):
+    """
+    Give each job a unique name, from its cloud's file name, to name its output files by.
+
+    :param jobs: List of the jobs. A "name" is added to each one.
+    """
+    counts = {}
+
+    for job in jobs:
+        name = os.path.splitext(os.path.basename(job["path"]))[0]
+        counts[name] = counts.get(name, 0) + 1
+        job["name"] = name if counts[name] == 1 else f"{name}_{counts[name]}"
+
+
+def run_job(job: dict, output_dir: str, mesh_format: str, time_limit: float, limit_iterations: int,
+            max_hole_size: int) -> dict:
+    """
+    Mesh one cloud with its radii, fill its holes and write the mesh. If the time limit runs out while meshing, the
+    meshing stops and the mesh made so far is written.
+
+    :param job: The job, with the cloud's "path", "radii" and "name".
+    :param output_dir: Directory to write the mesh to.
+    :param mesh_format: Extension of the mesh file: ".ply", ".stl" or ".obj".
+    :param time_limit: Seconds the job may take, or None.
+    :param limit_iterations: Maximal number of iterations for each radius.
+    :param max_hole_size: Maximal number of edges of the holes to fill, 0 to not fill holes.
+    :return: Dictionary of the job's stats. Times are in seconds.
+    """
+    start = time.perf_counter()
+    bpa = BPA(job["path"], job["radii"][0])
+    times = {"load": time.perf_counter() - start}
+
+    time_budget = None if time_limit is None else max(time_limit - times["load"], 0)
+    status, mesh_times, num_unfilled_holes = mesh_radii(bpa, job["radii"], limit_iterations,
+                                                        max_hole_size=max_hole_size, time_budget=time_budget)
+    times.update(mesh_times)
+    triangles = unique_triangles(bpa)
+
+    phase_start = time.perf_counter()
+    output_path = os.path.join(output_dir, job["name"] + mesh_format)
+    write_mesh(output_path, bpa.points.coordinates, triangles, bpa.points.normals)
+    times["export"] = time.perf_counter() - phase_start
+
+    return {
+        "status": status,
+        "output_path": output_path,
+        "num_points": len(bpa.points),
+        "num_triangles": len(triangles),
+        "num_boundary_edges": bpa.grid.count_boundary_edges(),
+        "num_unfilled_holes": num_unfilled_holes,
+        "times": times,
+        "total_time": time.perf_counter() - start,
+        "peak_memory": get_peak_memory(),
+    }
+
+
+def job_process(connection, job: dict, memory_limit: int, options: dict):
+    """
+    Run a job in its own process, and send its stats, or its error, to the scheduler.
+
+    :param connection: Connection to send the result on.
+    :param job: The job.
+    :param memory_limit: Bytes of address space the process may use, or None. Allocations above it raise an error,
+    which fails the job.
+    :param options: Keyword arguments of run_job.
+    """
+    try:
+        if memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+        result = run_job(job, **options)
+    except BaseException as error:
+        result = {"status": "failed", "error": repr(error), "traceback": traceback.format_exc()}
+
+    connection.send(result)
+    connection.close()
+
+
+def run_batch(jobs: list, output_dir: str, num_workers: int = 1, time_limit: float = None, memory_limit: int = None,
+              mesh_format: str = ".ply", limit_iterations: int = np.inf, max_hole_size: int = 0) -> list:
+    """
+    Mesh many clouds, each one in its own process, with up to num_workers processes at a time. A job that fails,
+    runs out of memory or is killed for taking too long is recorded, and the other jobs go on. The stats of each job
+    are written next to its mesh, as <name>.json.
+
+    :param jobs: List of the jobs, as dictionaries with the cloud's "path" and "radii".
+    :param output_dir: Directory to write the meshes and stats to.
+    :param num_workers: Number of jobs to run at a time.
+    :param time_limit: Seconds each job may take, or None. A job stops meshing at its limit and writes what it made,
+    and is killed if it is not done KILL_GRACE_PERIOD seconds later.
+    :param memory_limit: Bytes of address space each job may use, or None.
+    :param mesh_format: Extension of the mesh files: ".ply", ".stl" or ".obj".
+    :param limit_iterations: Maximal number of iterations for each radius.
+    :param max_hole_size: Maximal number of edges of the holes to fill, 0 to not fill holes.
+    :return: List of the jobs' stats, in the order of the jobs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    name_jobs(jobs)
+
+    options = {"output_dir": output_dir, "mesh_format": mesh_format, "time_limit": time_limit,
+               "limit_iterations": limit_iterations, "max_hole_size": max_hole_size}
+    results = [None] * len(jobs)
+    pending = deque(enumerate(jobs))
+    running = {}  # Connection -> (process, job index, start time).
+
+    def finish(connection, result):
+        process, index, start = running.pop(connection)
+        connection.close()
+        process.join()
+
+        result.update(name=jobs[index]["name"], path=jobs[index]["path"], radii=jobs[index]["radii"],
+                      wall_time=time.monotonic() - start)
+        results[index] = result
+
+        with open(os.path.join(output_dir, jobs[index]["name"] + ".json"), "w") as f:
+            json.dump(result, f, indent=2)
+
+        print(f"{result['name']}: {result['status']}" +
+              (f", {result['num_triangles']} triangles" if "num_triangles" in result else "") +
+              (f", {result['error']}" if "error" in result else "") +
+              f", {result['wall_time']:.1f}s", flush=True)
+
+    while pending or running:
+        while pending and len(running) < num_workers:
+            index, job = pending.popleft()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=job_process, args=(sender, job, memory_limit, options))
+            process.start()
+            sender.close()
+            running[receiver] = (process, index, time.monotonic())
+
+        for connection in multiprocessing.connection.wait(list(running), timeout=POLL_INTERVAL):
+            try:
+                result = connection.recv()
+            except EOFError:
+                # The process died without a word, such as when the system killed it for its memory.
+                process = running[connection][0]
+                process.join()
+                result = {"status": "failed", "error": f"Process exited with code {process.exitcode}"}
+
+            finish(connection, result)
+
+        if time_limit is not None:
+            now = time.monotonic()
+
+            for connection, (process, index, start) in list(running.items()):
+                if now - start > time_limit + KILL_GRACE_PERIOD:
+                    process.kill()
+                    finish(connection, {"status": "killed", "error": f"Took over {time_limit + KILL_GRACE_PERIOD}s"})
+
+    return results
+
+
+if __name__ == "__main__":
+    # Mesh the clouds of a directory or manifest: python batch.py input output_dir [--radii 0.01 0.02] ...
+    parser = argparse.ArgumentParser(description="Mesh many point clouds with the ball pivoting algorithm.")
+    parser.add_argument("input", help="Directory of point cloud files, or manifest file of \"path [radius ...]\" "
+                                      "lines.")
+    parser.add_argument("output_dir", help="Directory to write the meshes and stats to.")
+    parser.add_argument("--radii", nargs="+", type=float, default=[0.03],
+                        help="Radii of the clouds that have no radii in the manifest.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of jobs to run at a time.")
+    parser.add_argument("--time-limit", type=float, default=None, help="Seconds each job may take.")
+    parser.add_argument("--memory-limit", type=float, default=None, help="MiB of address space each job may use.")
+    parser.add_argument("--format", default=".ply", choices=(".ply", ".stl", ".obj"), help="Mesh file format.")
+    parser.add_argument("--limit-iterations", type=int, default=None, help="Maximal number of iterations per radius.")
+    parser.add_argument("--max-hole-size", type=int, default=0, help="Maximal number of edges of the holes to fill.")
+    args = parser.parse_args()
+
+    jobs = find_jobs(args.input, args.radii)
+    results = run_batch(
+        jobs, args.output_dir, num_workers=max(args.workers, 1), time_limit=args.time_limit,
+        memory_limit=int(args.memory_limit * 2 ** 20) if args.memory_limit is not None else None,
+        mesh_format=args.format,
+        limit_iterations=args.limit_iterations if args.limit_iterations is not None else np.inf,
+        max_hole_size=args.max_hole_size)
+
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+    num_failed = sum(1 for result in results if result["status"] not in ("done", "timed out"))
+    print(f"{len(results) - num_failed} of {len(results)} clouds meshed")
+    raise SystemExit(1 if num_failed else 0)
@@ -0,0 +1,232 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ball_pivoting_algo import BPA, fill_missing_normals
+from instrumentation import get_peak_memory
+from mesh_io import write_mesh
+from point import PointCloud
+from point_io import load_points, write_binary_points
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+# Bundled clouds and the ball radius each one is meshed with.
+DATASETS = [
+    ("sphere", "sphere_point_cloud_with_1000_even_normals.txt", 0.03),
+    ("bunny", "bunny_with_normals.txt", 0.01),
+    ("spot", "spot.txt", 0.05),
+    ("fandisk", "fandisk.txt", 0.1),
+    ("cheburashka", "cheburashka.txt", 0.012),
+]
+
+# Numbers of points of the synthetic clouds.
+SYNTHETIC_SIZES = [10_000, 100_000]
+
+# Numbers of points of the synthetic clouds that are only run when asked for, since they take long and a lot of memory.
+LARGE_SYNTHETIC_SIZES = [1_000_000, 10_000_000]
+
+# Phases timed in each run, in the order they run.
+PHASES = ("load", "grid", "seeding", "expansion", "export")
+
+
+def make_sphere_cloud(num_points: int) -> PointCloud:
+    """
+    Spread points evenly on the unit sphere, along a Fibonacci spiral. The normals point outward.
+
+    :param num_points: Number of points.
+    :return: The point cloud, sorted by x like the loaders sort it.
+    """
+    ids = np.arange(num_points, dtype=np.float64) + 0.5
+    z = 1 - 2 * ids / num_points
+    ring_radius = np.sqrt(1 - z ** 2)
+    angle = np.pi * (1 + 5 ** 0.5) * ids
+    coordinates = np.column_stack((ring_radius * np.cos(angle), ring_radius * np.sin(angle), z))
+    coordinates = coordinates[np.argsort(coordinates[:, 0], kind="stable")]
+
+    return PointCloud(coordinates, coordinates)
+
+
+def sphere_cloud_radius(num_points: int) -> float:
+    """
+    Radius of the ball for a synthetic sphere cloud: about the distance between neighbouring points.
+
+    :param num_points: Number of points.
+    :return: The radius.
+    """
+    return float(np.sqrt(4 * np.pi / num_points))
+
+
+def run_case(name: str, path: str, radius: float, num_workers: int, limit_iterations: int) -> dict:
+    """
+    Mesh one cloud and measure it. Runs in its own process, so the peak memory is the case's own.
+
+    :param name: Name of the case.
+    :param path: Path of the point cloud file.
+    :param radius: Radius of the ball.
+    :param num_workers: Number of workers to mesh with.
+    :param limit_iterations: Maximal number of seeds and expansions.
+    :return: Dictionary of the case's measurements. Times are in seconds and memory in bytes.
+    """
+    times = dict.fromkeys(PHASES, 0.0)
+
+    start = time.perf_counter()
+    points = load_points(path, use_cache=False)
+
+    # Binary clouds are memory-mapped, and only read when their pages are touched. Copy them in, so the file is read
+    # in this phase and not during meshing.
+    points = fill_missing_normals(PointCloud(np.array(points.coordinates), np.array(points.normals)),
+                                  num_workers=num_workers)
+    times["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bpa = BPA(None, radius, num_workers=num_workers, points=points)
+    times["grid"] = time.perf_counter() - start
+
+    # Time the seed searches apart from the rest of meshing. Parallel tiles seed in their own processes, so only
+    # the seeds of the main process are counted then.
+    find_seed_triangle = bpa.find_seed_triangle
+
+    def timed_find_seed_triangle(*args, **kwargs):
+        seed_start = time.perf_counter()
+
+        try:
+            return find_seed_triangle(*args, **kwargs)
+        finally:
+            times["seeding"] += time.perf_counter() - seed_start
+
+    bpa.find_seed_triangle = timed_find_seed_triangle
+
+    start = time.perf_counter()
+    triangles = np.concatenate([np.empty((0, 3), dtype=np.int64)] +
+                               list(bpa.iter_mesh(limit_iterations=limit_iterations, batch_size=1 << 16)))
+    times["expansion"] = time.perf_counter() - start - times["seeding"]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        start = time.perf_counter()
+        write_mesh(os.path.join(temp_dir, "mesh.ply"), points.coordinates, triangles, points.normals)
+        times["export"] = time.perf_counter() - start
+
+    return {
+        "name": name,
+        "num_points": len(points),
+        "radius": radius,
+        "num_workers": num_workers,
+        "times": times,
+        "total_time": sum(times.values()),
+        "peak_memory": get_peak_memory(),
+        "num_triangles": len(triangles),
+        "num_boundary_edges": bpa.grid.count_boundary_edges(),
+    }
+
+
+def get_commit() -> str:
+    """
+    Find the git commit of the code being measured.
+
+    :return: The commit hash, or None if it is unknown.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(datasets: list, sizes: list, num_workers: int = 1, limit_iterations: int = np.inf,
+                  temp_dir: str = None) -> dict:
+    """
+    Run every case in a fresh process, one at a time.
+
+    :param datasets: List of (name, file name in DATA_DIR, radius) of the bundled clouds to run.
+    :param sizes: Numbers of points of the synthetic clouds to run.
+    :param num_workers: Number of workers to mesh with.
+    :param limit_iterations: Maximal number of seeds and expansions of each case.
+    :param temp_dir: Directory for the synthetic cloud files. Defaults to the system's.
+    :return: Dictionary of the run's environment and the results of the cases.
+    """
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as cloud_dir:
+        cases = [(name, os.path.join(DATA_DIR, file_name), radius) for name, file_name, radius in datasets]
+
+        for num_points in sizes:
+            path = os.path.join(cloud_dir, f"sphere_{num_points}.bpc")
+            write_binary_points(path, make_sphere_cloud(num_points))
+            cases.append((f"synthetic_sphere_{num_points}", path, sphere_cloud_radius(num_points)))
+
+        for name, path, radius in cases:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, name, path, radius, num_workers, limit_iterations).result()
+
+            print(f"{result['name']:>28}: {result['num_points']:>9} points, {result['num_triangles']:>9} triangles, "
+                  f"{result['num_boundary_edges']:>7} boundary edges, "
+                  f"{result['peak_memory'] / 2 ** 20:8.1f} MiB, " +
+                  ", ".join(f"{phase} {result['times'][phase]:.3f}s" for phase in PHASES), flush=True)
+            results.append(result)
+
+    return {
+        "commit": get_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "num_cpus": os.cpu_count(),
+        "results": results,
+    }
+
+
+def compare_results(results: dict, baseline: dict):
+    """
+    Print how the times of each case changed from a baseline run. Ratios above 1 are slower than the baseline.
+
+    :param results: Results of the current run.
+    :param baseline: Results of the baseline run, read from its JSON file.
+    """
+    baseline_cases = {result["name"]: result for result in baseline["results"]}
+    print(f"Compared to commit {baseline.get('commit')}:")
+
+    for result in results["results"]:
+        base = baseline_cases.get(result["name"])
+
+        if base is None:
+            continue
+
+        ratios = [f"{phase} x{result['times'][phase] / base['times'][phase]:.2f}"
+                  for phase in PHASES if base["times"][phase] > 0]
+        print(f"{result['name']:>28}: total x{result['total_time'] / max(base['total_time'], 1e-9):.2f}, "
+              f"{', '.join(ratios)}, triangles {base['num_triangles']} -> {result['num_triangles']}")
+
+
+if __name__ == "__main__":
+    # Benchmark the meshing of the bundled and synthetic clouds: python benchmark.py [--sizes 10000 100000] [--large]
+    parser = argparse.ArgumentParser(description="Benchmark the ball pivoting algorithm.")
+    parser.add_argument("--datasets", nargs="*", default=[name for name, _, _ in DATASETS],
+                        help="Names of the bundled clouds to run.")
+    parser.add_argument("--sizes", nargs="*", type=int, default=SYNTHETIC_SIZES,
+                        help="Numbers of points of the synthetic clouds to run.")
+    parser.add_argument("--large", action="store_true",
+                        help=f"Run the synthetic clouds of {LARGE_SYNTHETIC_SIZES} points as well.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of workers to mesh with.")
+    parser.add_argument("--limit-iterations", type=int, default=None, help="Maximal number of iterations per case.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results file.")
+    parser.add_argument("--compare", default=None, help="JSON results file of a baseline run to compare to.")
+    args = parser.parse_args()
+
+    datasets = [dataset for dataset in DATASETS if dataset[0] in args.datasets]
+    limit_iterations = args.limit_iterations if args.limit_iterations is not None else np.inf
+    sizes = args.sizes + [size for size in LARGE_SYNTHETIC_SIZES if args.large and size not in args.sizes]
+    results = run_benchmark(datasets, sizes, num_workers=args.workers, limit_iterations=limit_iterations)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare_results(results, json.load(f))
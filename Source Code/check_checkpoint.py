@@ -0,0 +1,71 @@
+import os
+import tempfile
+from ball_pivoting_algo import BPA
+from Holefilling import mesh_radii
+from point import PointCloud
+from point_io import load_points
+
+# Checks that a run stopped and resumed from its checkpoint makes the same mesh as a run that was not stopped: run with
+# python check_checkpoint.py.
+
+PATH = "../data/bunny_with_normals.txt"
+
+# Radii of the multi-pass run.
+RADII = [0.01, 0.02]
+
+# Numbers of times the runs check if they were cancelled before they stop: in the first radius, at the end of the
+# first radius and in the second radius.
+STOP_AFTER = [300, 1080, 1300]
+
+
+class CancelAfter:
+    """
+    Cancel that is set after a number of checks, so the run stops at the same point each time.
+    """
+
+    def __init__(self, num_checks: int):
+        self.num_checks = num_checks
+
+    def is_set(self) -> bool:
+        self.num_checks -= 1
+        return self.num_checks < 0
+
+
+def make_bpa(cloud: PointCloud) -> BPA:
+    """
+    Make a BPA with a fresh copy of the cloud.
+
+    :param cloud: The loaded cloud.
+    :return: The BPA, with the first radius.
+    """
+    return BPA(None, RADII[0], points=PointCloud(cloud.coordinates.copy(), cloud.normals.copy()))
+
+
+cloud = load_points(PATH, use_cache=False)
+
+whole = make_bpa(cloud)
+mesh_radii(whole, RADII)
+print(f"whole run: {len(whole.grid.triangles)} triangles")
+
+with tempfile.TemporaryDirectory() as temp_dir:
+    for num_checks in STOP_AFTER:
+        checkpoint_path = os.path.join(temp_dir, f"stop_{num_checks}.npz")
+
+        stopped = make_bpa(cloud)
+        status, _, _ = mesh_radii(stopped, RADII, cancel=CancelAfter(num_checks), checkpoint_path=checkpoint_path)
+        assert status == "cancelled", f"The run was not stopped after {num_checks} checks."
+
+        resumed = make_bpa(cloud)
+        resumed.load_checkpoint(checkpoint_path)
+        first_pass = resumed.checkpoint_info.get("completed_passes", 0)
+        assert resumed.grid.triangles == stopped.grid.triangles, "The checkpoint did not restore the mesh."
+
+        mesh_radii(resumed, RADII, checkpoint_path=checkpoint_path, first_pass=first_pass)
+        print(f"stopped after {num_checks} checks with {len(stopped.grid.triangles)} triangles, in radius "
+              f"{RADII[first_pass]}: {len(resumed.grid.triangles)} triangles after resuming")
+
+        # The resumed run must go on exactly as the whole run did, to the same triangles in the same order.
+        assert resumed.grid.triangles == whole.grid.triangles, "The resumed run made another mesh."
+        assert resumed.grid.edge_faces == whole.grid.edge_faces, "The resumed run has other edges."
+
+print("OK")
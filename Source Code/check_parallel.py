@@ -0,0 +1,56 @@
+import time
+from ball_pivoting_algo import BPA
+from benchmark import make_sphere_cloud, sphere_cloud_radius
+from point import PointCloud
+
+# Checks that meshing in parallel tiles makes a mesh as whole as meshing serially: run with python check_parallel.py.
+
+# Number of points of the sphere cloud. The seams must be long enough to show in the counts.
+NUM_POINTS = 5000
+
+# Number of worker processes of the parallel run.
+NUM_WORKERS = 2
+
+# How much worse than the serial mesh the stitched one may be: a fraction of the serial count, plus a constant.
+TOLERANCE = (0.1, 10)
+
+
+def mesh_sphere(num_workers):
+    """
+    Mesh the sphere cloud, and measure the mesh.
+
+    :param num_workers: Number of workers to mesh with.
+    :return: Dictionary of the number of triangles, open edges and the Euler characteristic, and the seconds it took.
+    """
+    cloud = make_sphere_cloud(NUM_POINTS)
+    bpa = BPA(None, sphere_cloud_radius(NUM_POINTS), num_workers=num_workers, points=cloud)
+
+    start = time.perf_counter()
+    bpa.generate_mesh()
+
+    return {
+        "num_triangles": len(bpa.grid.triangles),
+        "num_open_edges": bpa.grid.count_boundary_edges(),
+        "euler_characteristic": bpa.grid.euler_characteristic(),
+        "time": time.perf_counter() - start,
+    }
+
+
+if __name__ == "__main__":
+    # The workers import this file, so the checks only run in the main process.
+    serial = mesh_sphere(1)
+    parallel = mesh_sphere(NUM_WORKERS)
+    print(f"serial: {serial}")
+    print(f"{NUM_WORKERS} workers: {parallel}")
+
+    # A closed mesh of N points has 2N - 4 triangles. More than that means triangles overlap.
+    assert parallel["num_triangles"] <= 2 * NUM_POINTS - 4, "The stitched triangles overlap."
+
+    assert parallel["num_open_edges"] <= serial["num_open_edges"] * (1 + TOLERANCE[0]) + TOLERANCE[1], \
+        "The seams left more open edges than the serial mesh has."
+
+    # Each hole lowers the Euler characteristic, so the stitched mesh may not be further from 2 than the serial one.
+    assert 2 - parallel["euler_characteristic"] <= (2 - serial["euler_characteristic"]) * (1 + TOLERANCE[0]) + \
+        TOLERANCE[1], "The seams left more holes than the serial mesh has."
+
+    print("OK")
@@ -0,0 +1,67 @@
+import base64
+import json
+import numpy as np
+from service import parse_request
+
+# Checks that the service turns down bad job requests, which it answers with 400: run with python check_service.py.
+
+# A cloud file the good requests point at.
+PATH = "../data/bunny_with_normals.txt"
+
+# Base64 of two uploaded points.
+COORDINATES = base64.b64encode(np.zeros((2, 3), dtype="<f4").tobytes()).decode()
+
+GOOD_REQUESTS = [
+    {"path": PATH, "radii": [0.01]},
+    {"path": PATH, "radii": [0.01, 0.02], "limit_iterations": 100, "time_budget": 1.5, "max_hole_size": 0,
+     "batch_size": 10},
+    {"coordinates": COORDINATES, "normals": COORDINATES, "radii": [1]},
+]
+
+# Bodies as sent, since JSON text such as Infinity and NaN has no Python value json.dumps writes back the same way.
+BAD_BODIES = [
+    b"",
+    b"\xff\xfe",
+    b"[" * 100000,
+    b"[]",
+    b'"path"',
+    b'{"radii": [0.01]}',
+    f'{{"path": "{PATH}", "coordinates": "{COORDINATES}", "radii": [0.01]}}'.encode(),
+    b'{"path": ["x"], "radii": [0.01]}',
+    b'{"path": "no/such/file.txt", "radii": [0.01]}',
+    b'{"coordinates": 123, "radii": [1]}',
+    b'{"coordinates": "not base64!", "radii": [1]}',
+    b'{"coordinates": "AAAA", "radii": [1]}',
+    f'{{"coordinates": "{COORDINATES}", "normals": [1, 2, 3], "radii": [1]}}'.encode(),
+    f'{{"path": "{PATH}"}}'.encode(),
+    f'{{"path": "{PATH}", "radii": 0.01}}'.encode(),
+    f'{{"path": "{PATH}", "radii": []}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [-0.01]}}'.encode(),
+    f'{{"path": "{PATH}", "radii": ["0.01"]}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [true]}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [Infinity]}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [NaN]}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "limit_iterations": true}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "limit_iterations": 0}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "limit_iterations": 1.5}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "batch_size": "10"}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "max_hole_size": -1}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "max_hole_size": false}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "time_budget": -1}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "time_budget": Infinity}}'.encode(),
+    f'{{"path": "{PATH}", "radii": [0.01], "time_budget": null}}'.encode(),
+]
+
+for request in GOOD_REQUESTS:
+    assert parse_request(json.dumps(request).encode()) == request, f"Turned down a good request: {request}"
+
+for body in BAD_BODIES:
+    # Any other exception would be a 500, or close the connection.
+    try:
+        parse_request(body)
+    except ValueError as error:
+        print(f"{body[:60]}: {error}")
+    else:
+        raise AssertionError(f"Accepted a bad request: {body[:60]}")
+
+print("OK")
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import numpy as np
+from ball_pivoting_algo import BPA
+from benchmark import make_sphere_cloud, sphere_cloud_radius
+from point import PointCloud
+from point_io import write_binary_points
+from streaming import stream_mesh
+
+# Checks that meshing slab by slab makes a mesh as whole as meshing at once: run with python check_streaming.py.
+
+# Number of points of the sphere cloud.
+NUM_POINTS = 5000
+
+# Number of points in a slab, small enough to make several walls.
+SLAB_SIZE = 1000
+
+# How much worse than the serial mesh the streamed one may be: a fraction of the serial count, plus a constant.
+TOLERANCE = (0.1, 10)
+
+
+def measure(triangles):
+    """
+    Measure a mesh.
+
+    :param triangles: Array of the triangles, as rows of 3 point ids.
+    :return: Dictionary of the number of triangles, open edges and the Euler characteristic.
+    """
+    edges = np.sort(np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [0, 2]])), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+
+    return {
+        "num_triangles": len(triangles),
+        "num_open_edges": int(np.count_nonzero(counts == 1)),
+        "euler_characteristic": len(np.unique(triangles)) - len(edges) + len(triangles),
+    }
+
+
+cloud = make_sphere_cloud(NUM_POINTS)
+radius = sphere_cloud_radius(NUM_POINTS)
+
+bpa = BPA(None, radius, points=PointCloud(cloud.coordinates, cloud.normals))
+bpa.generate_mesh()
+serial = measure(np.array(bpa.grid.triangles, dtype=np.int64).reshape(-1, 3))
+
+with tempfile.TemporaryDirectory() as temp_dir:
+    cloud_path = os.path.join(temp_dir, "sphere.bpc")
+    triangles_path = os.path.join(temp_dir, "triangles.bin")
+    write_binary_points(cloud_path, cloud)
+
+    stream_mesh(cloud_path, radius, triangles_path, slab_size=SLAB_SIZE)
+    streamed = measure(np.fromfile(triangles_path, dtype="<i8").reshape(-1, 3))
+
+    # A cloud that is not sorted by x can not be streamed.
+    write_binary_points(cloud_path, PointCloud(cloud.coordinates[::-1], cloud.normals[::-1]))
+
+    try:
+        stream_mesh(cloud_path, radius, triangles_path, slab_size=SLAB_SIZE)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("An unsorted cloud was streamed.")
+
+print(f"serial: {serial}")
+print(f"slabs of {SLAB_SIZE} points: {streamed}")
+
+# A closed mesh of N points has 2N - 4 triangles. More than that means triangles overlap.
+assert streamed["num_triangles"] <= 2 * NUM_POINTS - 4, "The streamed triangles overlap."
+
+assert streamed["num_open_edges"] <= serial["num_open_edges"] * (1 + TOLERANCE[0]) + TOLERANCE[1], \
+    "The walls left more open edges than the serial mesh has."
+
+# Each hole lowers the Euler characteristic, so the streamed mesh may not be further from 2 than the serial one.
+assert 2 - streamed["euler_characteristic"] <= (2 - serial["euler_characteristic"]) * (1 + TOLERANCE[0]) + \
+    TOLERANCE[1], "The walls left more holes than the serial mesh has."
+
+print("OK")
@@ -0,0 +1,147 @@
+import json
+import os
+import numpy as np
+from Tracker import Edge, ACTIVE, BOUNDARY, FROZEN
+
+# Version of the checkpoint file layout. Files of other versions are not read.
+CHECKPOINT_VERSION = 1
+
+# Edge states, by their code in a checkpoint file.
+EDGE_STATES = (ACTIVE, BOUNDARY, FROZEN)
+
+
+def pack_lists(lists: dict, keys: list, dtype) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Flatten the lists of a dictionary CSR style.
+
+    :param lists: Dictionary of lists.
+    :param keys: Keys of the lists, in the order to flatten them.
+    :param dtype: Type of the values.
+    :return: Array of the values, and array of offsets: the list of keys[i] is values[offsets[i]:offsets[i + 1]].
+    """
+    counts = np.array([len(lists[key]) for key in keys], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    values = np.fromiter((value for key in keys for value in lists[key]), dtype=dtype, count=int(offsets[-1]))
+
+    return values, offsets
+
+
+def save_checkpoint(bpa, path: str, info: dict = None):
+    """
+    Save the state of a BPA run to a binary file, a numpy .npz archive: the points flags, the seed cursor, the edges
+    and triangles of the mesh and the front. The file is written next to its final path and then renamed, so a crash
+    while saving keeps the previous checkpoint.
+
+    :param bpa: The BPA.
+    :param path: Path of the checkpoint file.
+    :param info: Extra values to save, as a dictionary of JSON types, such as the progress of a multi-pass run.
+    """
+    grid = bpa.grid
+    id_type = np.int32 if len(bpa.points) < 2 ** 31 else np.int64
+
+    # Edges in their own direction, with the key of each one in the same order.
+    edges = list(grid.edges.values())
+    edge_keys = list(grid.edges.keys())
+    edge_rows = {key: row for row, key in enumerate(edge_keys)}
+    edge_points = np.array([[edge.p1, edge.p2] for edge in edges], dtype=id_type).reshape(-1, 2)
+    edge_states = np.array([EDGE_STATES.index(edge.state) for edge in edges], dtype=np.uint8)
+
+    # Third points of the triangles on each edge, in the order they were recorded.
+    edge_triangles, edge_triangle_offsets = pack_lists(grid.edge_triangles, edge_keys, id_type)
+
+    def edge_ids(open_edges) -> np.ndarray:
+        return np.array([edge_rows[grid.edge_key(edge.p1, edge.p2)] for edge in open_edges], dtype=np.int64)
+
+    temp_path = f"{path}.{os.getpid()}.tmp.npz"
+
+    np.savez(
+        temp_path,
+        version=np.array(CHECKPOINT_VERSION),
+        num_points=np.array(len(bpa.points)),
+        radius=np.array(bpa.radius),
+        seed_cursor=np.array(bpa.first_free_point_index),
+        front_counter=np.array(bpa.front_counter),
+        info=np.array(json.dumps(info or {})),
+        is_used=np.packbits(bpa.points.is_used),
+        seed_rejected=np.packbits(bpa.seed_rejected),
+        triangles=np.array(grid.triangles, dtype=id_type).reshape(-1, 3),
+        edge_points=edge_points,
+        edge_states=edge_states,
+        edge_triangles=edge_triangles,
+        edge_triangle_offsets=edge_triangle_offsets,
+        front_edges=edge_ids(edge for _, _, edge in bpa.front),
+        front_priorities=np.array([priority for priority, _, _ in bpa.front], dtype=np.float64),
+        front_counters=np.array([counter for _, counter, _ in bpa.front], dtype=np.int64),
+        boundary_edges=edge_ids(bpa.boundary_edges),
+        deferred_edges=edge_ids(bpa.deferred_edges),
+    )
+
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(bpa, path: str) -> dict:
+    """
+    Restore the state of a BPA run from a checkpoint file. The BPA must have the same points the checkpoint was saved
+    with, and an empty mesh.
+
+    :param bpa: The BPA.
+    :param path: Path of the checkpoint file.
+    :return: The extra values saved with the checkpoint.
+    """
+    with np.load(path) as data:
+        if int(data["version"]) != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} is a checkpoint of version {int(data['version'])}, expected "
+                             f"{CHECKPOINT_VERSION}.")
+
+        num_points = len(bpa.points)
+
+        if int(data["num_points"]) != num_points:
+            raise ValueError(f"{path} is a checkpoint of a cloud with {int(data['num_points'])} points, not "
+                             f"{num_points}.")
+
+        grid = bpa.grid
+
+        if grid.triangles or grid.edges:
+            raise ValueError("Checkpoints can only be loaded into a BPA with an empty mesh.")
+
+        radius = float(data["radius"])
+
+        if radius != bpa.radius:
+            bpa.set_radius(radius)
+
+        bpa.points.is_used[:] = np.unpackbits(data["is_used"], count=num_points).astype(bool)
+        bpa.seed_rejected[:] = np.unpackbits(data["seed_rejected"], count=num_points).astype(bool)
+        bpa.first_free_point_index = int(data["seed_cursor"])
+        bpa.front_counter = int(data["front_counter"])
+
+        # Edges, with their triangles as they were recorded, closed paths included.
+        edges = []
+        edge_triangles = data["edge_triangles"].tolist()
+        edge_triangle_offsets = data["edge_triangle_offsets"].tolist()
+
+        for row, ((p1, p2), state) in enumerate(zip(data["edge_points"].tolist(), data["edge_states"].tolist())):
+            edge = Edge(p1, p2)
+            edge.state = EDGE_STATES[state]
+            grid.add_edge(edge)
+            edges.append(edge)
+
+            third_points = edge_triangles[edge_triangle_offsets[row]:edge_triangle_offsets[row + 1]]
+
+            if third_points:
+                grid.edge_triangles[grid.edge_key(p1, p2)] = third_points
+
+        # The mesh's triangles. Their edges are recorded already, so only the faces of each edge are rebuilt.
+        for p1, p2, p3 in data["triangles"].tolist():
+            grid.triangles.append([p1, p2, p3])
+
+            for a, b, c in ((p1, p2, p3), (p2, p3, p1), (p1, p3, p2)):
+                grid.edge_faces.setdefault(grid.edge_key(a, b), []).append(c)
+
+        # The front keeps its heap order.
+        bpa.front = [(priority, counter, edges[row]) for priority, counter, row in
+                     zip(data["front_priorities"].tolist(), data["front_counters"].tolist(),
+                         data["front_edges"].tolist())]
+        bpa.boundary_edges = [edges[row] for row in data["boundary_edges"].tolist()]
+        bpa.deferred_edges = [edges[row] for row in data["deferred_edges"].tolist()]
+
+        return json.loads(str(data["info"]))
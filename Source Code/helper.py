@@ -1,64 +1,119 @@
-import math
 import numpy as np
 
 
-def calc_distance_points(p1, p2) -> float:
+def calc_distance_points(p1, p2):
     """
-    Calculate the distance between 2 3D points.
+    Calculate the distance between 2 3D points. Works on arrays of points as well.
 
-    :param p1: First point.
-    :param p2: Second point.
+    :param p1: Coordinates of the first point(s).
+    :param p2: Coordinates of the second point(s).
     :return: Distance between the points.
     """
-    return math.sqrt(math.pow((p2.x - p1.x), 2) + math.pow((p2.y - p1.y), 2) + math.pow((p2.z - p1.z), 2))
+    return np.sqrt(np.sum(np.square(np.subtract(p2, p1)), axis=-1))
 
 
-def calc_distance_point_to_edge(point, edge) -> float:
+def calc_distance_point_to_edge(point, edge_p1, edge_p2):
     """
     Calculate the distance of a point to an edge. Taken from here: https://math.stackexchange.com/q/1905581
 
-    :param point: The point.
-    :param edge: The edge.
+    :param point: Coordinates of the point.
+    :param edge_p1: Coordinates of the first point of the edge.
+    :param edge_p2: Coordinates of the second point of the edge.
     :return: The distance.
     """
-    v1 = [edge.p1.x - point.x, edge.p1.y - point.y, edge.p1.z - point.z]
-    v2 = [edge.p1.x - edge.p2.x, edge.p1.y - edge.p2.y, edge.p1.z - edge.p2.z]
-    return np.linalg.norm(np.cross(v1, v2)) / np.linalg.norm(v2)
+    v1 = np.subtract(edge_p1, point)
+    v2 = np.subtract(edge_p1, edge_p2)
+    return np.linalg.norm(np.cross(v1, v2), axis=-1) / np.linalg.norm(v2, axis=-1)
 
 
-def calc_incircle_radius(p1, p2, p3) -> float:
+def calc_ball_centers(p1, p2, p3, radius):
     """
-    Calculate the radius of the incircle in a triangle.
-    Based on this formula:
-     https://en.wikipedia.org/wiki/Incircle_and_excircles_of_a_triangle#Radius
+    Calculate the center of the ball with a given radius that touches the 3 points of a triangle. Of the 2 such balls,
+    this is the one on the side the triangle's normal (p2 - p1) x (p3 - p1) points to. Works on arrays of triangles as
+    well.
+
+    :param p1: Coordinates of the first point of triangle.
+    :param p2: Coordinates of the second point of triangle.
+    :param p3: Coordinates of the third point of triangle.
+    :param radius: Radius of the ball.
+    :return: Centers of the balls and a mask of the triangles the ball fits, where the circumcircle radius is at most
+    the ball's radius and the triangle is not degenerate.
+    """
+    v1 = np.subtract(p2, p1)
+    v2 = np.subtract(p3, p1)
+    normal = np.cross(v1, v2)
+    normal_length_2 = np.sum(np.square(normal), axis=-1, keepdims=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Circumcenter of the triangle, relative to p1.
+        circumcenter = (np.sum(np.square(v2), axis=-1, keepdims=True) * np.cross(normal, v1) +
+                        np.sum(np.square(v1), axis=-1, keepdims=True) * np.cross(v2, normal)) / (2 * normal_length_2)
+
+        # Height of the ball's center above the triangle's plane.
+        height_2 = radius ** 2 - np.sum(np.square(circumcenter), axis=-1, keepdims=True)
+        centers = p1 + circumcenter + np.sqrt(np.maximum(height_2, 0)) * normal / np.sqrt(normal_length_2)
 
-    :param p1: First point of triangle.
-    :param p2: Second point of triangle.
-    :param p3: Third point of triangle.
-    :return: The radius of the incircle.
+    fits = (normal_length_2[..., 0] > 0) & (height_2[..., 0] >= 0)
+    return centers, fits
+
+
+def calc_pivot_angles(p1, p2, start_center, centers):
+    """
+    Calculate the angle a ball rotates around the edge p1-p2, from start_center to each of centers. The rotation is
+    counterclockwise around the direction p2 - p1. Works on an array of centers.
+
+    :param p1: Coordinates of the first point of the edge.
+    :param p2: Coordinates of the second point of the edge.
+    :param start_center: Center of the ball before pivoting.
+    :param centers: Center(s) of the ball after pivoting.
+    :return: Angle(s) in [0, 2 pi).
+    """
+    middle = (np.asarray(p1) + np.asarray(p2)) / 2
+    axis = np.subtract(p2, p1)
+    u0 = np.subtract(start_center, middle)
+    u1 = np.subtract(centers, middle)
+
+    angles = np.arctan2(np.cross(u0, u1) @ axis / np.linalg.norm(axis), u1 @ u0)
+    return np.mod(angles, 2 * np.pi)
+
+
+def is_same_side_of_edge(p1, p2, p3, p4):
+    """
+    Check if p4 is on the same side of the edge p1-p2 as p3, within the plane of the triangle p1, p2, p3.
+    Works on an array of p4 points as well.
+
+    :param p1: Coordinates of the first point of the edge.
+    :param p2: Coordinates of the second point of the edge.
+    :param p3: Coordinates of the third point of the triangle.
+    :param p4: Coordinates of the point(s) to check.
+    :return: Boolean (array).
     """
+    # Calculate the normal of the triangle
+    v1 = np.subtract(p3, p1)
+    v2 = np.subtract(p2, p1)
+    triangle_normal = np.cross(v1, v2)
 
-    edge_1_length = calc_distance_points(p1, p2)
-    edge_2_length = calc_distance_points(p2, p3)
-    edge_3_length = calc_distance_points(p1, p3)
+    # Calculate the normal to the plane defined by v2 and the triangle_normal (the plane orthogonal to
+    # the triangle).
+    plane_normal = np.cross(v2, triangle_normal)
 
-    s = (edge_1_length + edge_2_length + edge_3_length) / 2
-    r = math.sqrt(((s - edge_1_length)*(s - edge_2_length)*(s - edge_3_length)) / s)
-    return r
+    # Check if p4 is in the same side of the plane as p3.
+    v3 = np.subtract(p4, p1)
+    return np.sign(np.dot(v3, plane_normal)) == np.sign(np.dot(v1, plane_normal))
 
 
-def calc_min_max_angle_of_triangle(e1, e2, e3) -> tuple[float, float]:
+def calc_min_max_angle_of_triangle(p1, p2, p3) -> tuple[float, float]:
     """
     Calculate the minimum and maximum angles of a triangle.
 
-    :param e1: First edge.
-    :param e2: Second edge.
-    :param e3: Third edge.
+    :param p1: Coordinates of the first point of triangle.
+    :param p2: Coordinates of the second point of triangle.
+    :param p3: Coordinates of the third point of triangle.
     :return: minimum angel, maximum angel.
     """
-    v1 = [e1.p1.x - e1.p2.x, e1.p1.y - e1.p2.y, e1.p1.z - e1.p2.z]
-    v2 = [e2.p1.x - e2.p2.x, e2.p1.y - e2.p2.y, e2.p1.z - e2.p2.z]
-    v3 = [e3.p1.x - e3.p2.x, e3.p1.y - e3.p2.y, e3.p1.z - e3.p2.z]
+    v1 = np.subtract(p1, p2)
+    v2 = np.subtract(p2, p3)
+    v3 = np.subtract(p1, p3)
 
     angle1 = np.arccos((np.dot(v1, v2))/(np.linalg.norm(v1) * np.linalg.norm(v2))) * (180 / np.pi)
     angle2 = np.arccos((np.dot(v1, v3))/(np.linalg.norm(v1) * np.linalg.norm(v3))) * (180 / np.pi)
@@ -67,31 +122,50 @@ def calc_min_max_angle_of_triangle(e1, e2, e3) -> tuple[float, float]:
     return min(angle1, angle2, angle3), max(angle1, angle2, angle3)
 
 
-def encode_cell(x, y, z):
+# Number of bits of each cell coordinate in a cell code.
+CELL_BITS = 21
+MAX_CELL_COORDINATE = (1 << CELL_BITS) - 1
+
+
+def spread_bits(v):
     """
-    Encode 3 numbers into a single one.
+    Spread the lowest 21 bits of a number so there are 2 zero bits between each of them. Works on int64 arrays as well.
 
-    :param x: First number.
-    :param y: Second number.
-    :param z: Third number.
-    :return: Code.
+    :param v: The number.
+    :return: The spread number.
     """
-    # Assuming each coordinate is 8 bytes.
-    code = x | (y << 8) | (z << 16)
-    return code
+    v = v & 0x1fffff
+    v = (v | (v << 32)) & 0x1f00000000ffff
+    v = (v | (v << 16)) & 0x1f0000ff0000ff
+    v = (v | (v << 8)) & 0x100f00f00f00f00f
+    v = (v | (v << 4)) & 0x10c30c30c30c30c3
+    v = (v | (v << 2)) & 0x1249249249249249
+    return v
+
 
+def compact_bits(v):
+    """
+    Reverse spread_bits: gather every third bit of a number into its lowest 21 bits.
 
-def decode_cell(code):
+    :param v: The spread number.
+    :return: The number.
     """
-    Decode a unique number into 3 number.
+    v = v & 0x1249249249249249
+    v = (v ^ (v >> 2)) & 0x10c30c30c30c30c3
+    v = (v ^ (v >> 4)) & 0x100f00f00f00f00f
+    v = (v ^ (v >> 8)) & 0x1f0000ff0000ff
+    v = (v ^ (v >> 16)) & 0x1f00000000ffff
+    v = (v ^ (v >> 32)) & 0x1fffff
+    return v
+
 
-    :param code: The code
-    :return: 3 numbers.
+def encode_cell(x, y, z):
     """
-    mask_x = 0b000000000000000011111111
-    x = code & mask_x
-    mask_y = 0b000000001111111100000000
-    y = (code & mask_y) >> 8
-    z = code >> 16
-    return int(x), int(y), int(z)
+    Encode 3 cell coordinates into a single 64 bit Morton (Z-order) code. Works on int64 arrays as well.
 
+    :param x: First coordinate, between 0 and MAX_CELL_COORDINATE.
+    :param y: Second coordinate, between 0 and MAX_CELL_COORDINATE.
+    :param z: Third coordinate, between 0 and MAX_CELL_COORDINATE.
+    :return: Code.
+    """
+    return spread_bits(x) | (spread_bits(y) << 1) | (spread_bits(z) << 2)
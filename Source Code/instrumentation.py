@@ -0,0 +1,130 @@
+import cProfile
+import functools
+import io
+import pstats
+import resource
+import time
+from collections import Counter
+
+# Number of front iterations between two samples of the front's size.
+FRONT_SAMPLE_INTERVAL = 100
+
+
+def get_peak_memory() -> int:
+    """
+    Find the peak memory of the current process.
+
+    :return: Peak resident set size, in bytes.
+    """
+    # Linux reports the peak resident set size in kilobytes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class BPAStats:
+    """
+    Counters and timers of a BPA run (see BPA.enable_stats):
+    - calls and times: number of calls and total seconds of each instrumented method, including the methods it calls.
+    - rejections: number of candidate points or triangles turned down, by reason.
+    - front_sizes: (iteration, seconds since the stats were made, number of edges on the front) samples.
+    - profiles: cProfile.Profile of each phase ("seeding", "expansion"), if profiling is on.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.calls = Counter()
+        self.times = Counter()
+        self.rejections = Counter()
+        self.front_sizes = []
+        self.start_time = time.perf_counter()
+        self.profiles = {}
+        self.profile = profile
+
+    def wrap(self, name: str, method, phase: str = None):
+        """
+        Wrap a method so its calls are counted and timed.
+
+        :param name: Name the calls are counted under.
+        :param method: The bound method.
+        :param phase: Name of the profile the calls are profiled in, if profiling is on, or None.
+        :return: The wrapper.
+        """
+        profiler = None
+
+        if self.profile and phase is not None:
+            profiler = self.profiles.setdefault(phase, cProfile.Profile())
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if profiler is not None:
+                profiler.enable()
+
+            start = time.perf_counter()
+
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.times[name] += time.perf_counter() - start
+                self.calls[name] += 1
+
+                if profiler is not None:
+                    profiler.disable()
+
+        return wrapper
+
+    def reject(self, reason: str, count: int = 1):
+        """
+        Count candidates that were turned down.
+
+        :param reason: Why they were turned down.
+        :param count: Number of candidates.
+        """
+        if count:
+            self.rejections[reason] += int(count)
+
+    def sample_front(self, iteration: int, front_size: int):
+        """
+        Record the size of the front, every FRONT_SAMPLE_INTERVAL iterations.
+
+        :param iteration: Number of the iteration.
+        :param front_size: Number of edges on the front.
+        """
+        if iteration % FRONT_SAMPLE_INTERVAL == 0:
+            self.front_sizes.append((iteration, time.perf_counter() - self.start_time, front_size))
+
+    def profile_report(self, phase: str, limit: int = 20, sort_by: str = "cumulative") -> str:
+        """
+        Format the profile of a phase.
+
+        :param phase: Name of the phase.
+        :param limit: Number of functions to list.
+        :param sort_by: pstats sort key.
+        :return: The report, or an empty string if the phase was not profiled.
+        """
+        if phase not in self.profiles:
+            return ""
+
+        stream = io.StringIO()
+        pstats.Stats(self.profiles[phase], stream=stream).sort_stats(sort_by).print_stats(limit)
+        return stream.getvalue()
+
+    def summary(self) -> dict:
+        """
+        Gather the stats in plain types, such as for a JSON file.
+
+        :return: Dictionary of the stats.
+        """
+        return {
+            "calls": dict(self.calls),
+            "times": dict(self.times),
+            "rejections": dict(self.rejections),
+            "front_sizes": self.front_sizes,
+        }
+
+    def __str__(self):
+        lines = [f"{name}: {self.calls[name]} calls, {self.times[name]:.3f}s" for name in sorted(self.calls)]
+        lines += [f"rejected ({reason}): {count}" for reason, count in self.rejections.most_common()]
+
+        if self.front_sizes:
+            lines.append(f"front size: max {max(size for _, _, size in self.front_sizes)}, "
+                         f"{len(self.front_sizes)} samples")
+
+        return "\n".join(lines)
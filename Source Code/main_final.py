@@ -2,17 +2,36 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 from Holefilling import Multiple_Pass
+from mesh_io import write_mesh
 
-def plot_mesh(vertices, faces, title):
+# Maximal number of faces plot_mesh draws.
+MAX_PLOT_FACES = 50000
+
+def plot_mesh(vertices, faces, title, max_faces=MAX_PLOT_FACES, output_path=None, use_trisurf=False):
     """
-    Plots the 3D mesh using the vertices and faces.
+    Plots the 3D mesh using the vertices and faces, as a single collection of all the faces.
+
+    :param vertices: Array of the vertices.
+    :param faces: Array of faces, as rows of 3 vertex indices.
+    :param title: Title of the plot.
+    :param max_faces: Maximal number of faces to draw. Larger meshes are drawn from a random sample of their faces.
+    :param output_path: Path of a PNG file to save the plot to, instead of showing it. Works without a display.
+    :param use_trisurf: Whether to draw the mesh with plot_trisurf instead of a Poly3DCollection.
     """
+    faces = np.asarray(faces)
+
+    if len(faces) > max_faces:
+        sample = np.random.default_rng(0).choice(len(faces), size=max_faces, replace=False)
+        faces = faces[np.sort(sample)]
+
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
-    
-    for f in faces:
-        face_vertices = vertices[f]
-        poly = Poly3DCollection([face_vertices], alpha=0.7, edgecolor='k',facecolor = 'yellow')
+
+    if use_trisurf:
+        ax.plot_trisurf(vertices[:, 0], vertices[:, 1], vertices[:, 2], triangles=faces, alpha=0.7, edgecolor='k',
+                        linewidth=0.2, color='yellow')
+    else:
+        poly = Poly3DCollection(vertices[faces], alpha=0.7, edgecolor='k', linewidths=0.2, facecolor='yellow')
         ax.add_collection3d(poly)
 
     ax.set_xlim(vertices[:, 0].min(), vertices[:, 0].max())
@@ -22,41 +41,40 @@ def plot_mesh(vertices, faces, title):
     ax.set_ylabel("Y")
     ax.set_zlabel("Z")
     ax.set_title(title)
-    plt.show()
+
+    if output_path is not None:
+        fig.savefig(output_path, dpi=150)
+        plt.close(fig)
+    else:
+        plt.show()
 
 
-def triangles_to_numpy(triangles):
+def triangles_to_numpy(triangles, points):
     """
-    Converts BPA triangle output to a consistent NumPy array of vertices and faces.
+    Converts BPA triangle output to a consistent NumPy array of vertices and faces. Only the points that are in a
+    triangle are kept as vertices.
     """
-    vertices = []
-    faces = []
-    v2index = {}
-    index_counter = 0
-
-    for triangle_tuple in triangles:
-        face_indices = []
-        for vertex in triangle_tuple:
-            if vertex not in v2index:
-                v2index[vertex] = index_counter
-                vertices.append(vertex)
-                index_counter += 1
-            face_indices.append(v2index[vertex])
-        faces.append(face_indices)
-
-    vertices = np.array(vertices)
-    faces = np.array(faces)
+    faces = np.array([triangle.vertices for triangle in triangles], dtype=np.int64).reshape(-1, 3)
+    used_points, faces = np.unique(faces, return_inverse=True)
+
+    vertices = np.asarray(points.coordinates)[used_points]
+    faces = faces.reshape(-1, 3)
     return vertices, faces
 
 
-#radii = [0.01,0.009,0.008,0.007,0.0009,0.0005] # sphere
-#radii = np.arange(0.0001, 0.004, 0.0001).tolist()# bunny
-radii = [0.005]
-path='sphere_point_cloud_with_500_even_normals.txt'
+#radii = [0.025,0.03,0.04] # sphere
+#radii = [0.0075,0.01,0.015] # bunny
+radii = [0.03]
+path='../data/sphere_point_cloud_with_1000_even_normals.txt'
+output_path='sphere_mesh.ply'
+plot_path=None # Set to a .png path to save the plot instead of showing it, e.g. on a server without a display.
+
+points, final_triangle = Multiple_Pass(radii,path,2250) #this works for single radius as well but the radius should be in a list
 
-final_triangle = Multiple_Pass(radii,path,2250) #this works for single radius as well but the radius should be in a list
+vertices,faces = triangles_to_numpy(final_triangle, points)
 
-vertices,faces = triangles_to_numpy(final_triangle)
+# Save the final combined mesh
+write_mesh(output_path, points.coordinates, [triangle.vertices for triangle in final_triangle], points.normals)
 
 # Plot the final combined mesh
-plot_mesh(vertices, faces, "Final 3D Mesh")
+plot_mesh(vertices, faces, "Final 3D Mesh", output_path=plot_path)
@@ -0,0 +1,206 @@
+import os
+import numpy as np
+
+# Mesh file formats, by extension.
+MESH_EXTENSIONS = (".ply", ".stl", ".obj")
+
+# Number of vertices or faces written at a time. Bounds the memory of the formatted or packed block.
+WRITE_CHUNK_SIZE = 1 << 20
+
+# Record of a binary STL facet: normal, 3 vertices and an unused attribute.
+STL_FACET = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attribute", "<u2"),
+])
+
+# Record of a binary PLY face: number of vertices and their indices.
+PLY_FACE = np.dtype([
+    ("count", "u1"),
+    ("vertices", "<i4", (3,)),
+])
+
+# Digits reserved in the PLY header for the number of faces, which is only known when the file is closed.
+PLY_FACE_COUNT_DIGITS = 10
+
+
+class MeshWriter:
+    """
+    Writes a mesh to a binary PLY, binary STL or OBJ file, by the file extension. The vertices are written first, and
+    the faces are added in batches, so a mesh can be written while it is made. Faces are rows of 3 vertex indices.
+    """
+
+    def __init__(self, path: str, vertices: np.ndarray, normals: np.ndarray = None):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower()
+
+        if self.format not in MESH_EXTENSIONS:
+            raise ValueError(f"Unknown mesh file format {self.format}, expected one of {MESH_EXTENSIONS}.")
+
+        if self.format == ".ply" and len(vertices) >= 2 ** 31:
+            raise ValueError("PLY files can not index more than 2^31 vertices.")
+
+        self.vertices = vertices
+        self.normals = normals
+        self.num_faces = 0
+        self.face_count_offset = 0
+        self.file = open(path, "wb")
+
+        try:
+            self.write_header()
+        except BaseException:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_header(self):
+        """
+        Write the file's header and its vertices.
+        """
+        if self.format == ".stl":
+            # 80 bytes of header, then the number of facets, filled in on close.
+            self.file.write(b"Binary STL written by the ball pivoting algorithm".ljust(80, b" "))
+            self.file.write(np.zeros(1, dtype="<u4").tobytes())
+            return
+
+        num_vertices = len(self.vertices)
+
+        if self.format == ".ply":
+            normal_properties = "property float nx\nproperty float ny\nproperty float nz\n" \
+                if self.normals is not None else ""
+            header_start = (f"ply\nformat binary_little_endian 1.0\nelement vertex {num_vertices}\n"
+                            f"property float x\nproperty float y\nproperty float z\n{normal_properties}"
+                            f"element face ")
+            self.file.write(header_start.encode())
+            self.face_count_offset = self.file.tell()
+            self.file.write(("0" * PLY_FACE_COUNT_DIGITS + "\n"
+                             "property list uchar int vertex_indices\nend_header\n").encode())
+
+            for start in range(0, num_vertices, WRITE_CHUNK_SIZE):
+                block = np.asarray(self.vertices[start:start + WRITE_CHUNK_SIZE], dtype="<f4")
+
+                if self.normals is not None:
+                    block = np.hstack((block, np.asarray(self.normals[start:start + WRITE_CHUNK_SIZE], dtype="<f4")))
+
+                self.file.write(np.ascontiguousarray(block).tobytes())
+            return
+
+        # OBJ: one "v" line per vertex, and one "vn" line per vertex normal.
+        for start in range(0, num_vertices, WRITE_CHUNK_SIZE):
+            block = np.asarray(self.vertices[start:start + WRITE_CHUNK_SIZE], dtype=np.float64)
+            self.file.write((("v %.9g %.9g %.9g\n" * len(block)) % tuple(block.ravel().tolist())).encode())
+
+        if self.normals is not None:
+            for start in range(0, num_vertices, WRITE_CHUNK_SIZE):
+                block = np.asarray(self.normals[start:start + WRITE_CHUNK_SIZE], dtype=np.float64)
+                self.file.write((("vn %.9g %.9g %.9g\n" * len(block)) % tuple(block.ravel().tolist())).encode())
+
+    def write_faces(self, faces: np.ndarray):
+        """
+        Add a batch of faces to the file.
+
+        :param faces: Array of faces, as rows of 3 vertex indices.
+        """
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+        for start in range(0, len(faces), WRITE_CHUNK_SIZE):
+            block = faces[start:start + WRITE_CHUNK_SIZE]
+
+            if self.format == ".ply":
+                records = np.empty(len(block), dtype=PLY_FACE)
+                records["count"] = 3
+                records["vertices"] = block
+                self.file.write(records.tobytes())
+
+            elif self.format == ".stl":
+                records = np.zeros(len(block), dtype=STL_FACET)
+                corners = np.asarray(self.vertices[block.ravel()], dtype=np.float32).reshape(-1, 3, 3)
+                normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+                records["vertices"] = corners
+                self.file.write(records.tobytes())
+
+            else:
+                # OBJ indices start at 1. Each vertex has the normal with its own index.
+                if self.normals is not None:
+                    line = "f %d//%d %d//%d %d//%d\n"
+                    values = np.repeat(block + 1, 2, axis=1)
+                else:
+                    line = "f %d %d %d\n"
+                    values = block + 1
+
+                self.file.write(((line * len(block)) % tuple(values.ravel().tolist())).encode())
+
+        self.num_faces += len(faces)
+
+    def close(self):
+        """
+        Fill in the number of faces and close the file.
+        """
+        if self.file.closed:
+            return
+
+        if self.format == ".ply":
+            self.file.seek(self.face_count_offset)
+            self.file.write(str(self.num_faces).zfill(PLY_FACE_COUNT_DIGITS).encode())
+        elif self.format == ".stl":
+            self.file.seek(80)
+            self.file.write(np.array([self.num_faces], dtype="<u4").tobytes())
+
+        self.file.close()
+
+
+def compact_mesh(vertices: np.ndarray, faces: np.ndarray, normals: np.ndarray = None) -> tuple:
+    """
+    Keep only the vertices that are in a face, and index the faces by the kept vertices.
+
+    :param vertices: Array of the vertices.
+    :param faces: Array of faces, as rows of 3 vertex indices.
+    :param normals: Array of the vertex normals, or None.
+    :return: The kept vertices, the re-indexed faces and the kept normals (or None).
+    """
+    used_vertices, faces = np.unique(np.asarray(faces, dtype=np.int64).ravel(), return_inverse=True)
+    kept_normals = np.asarray(normals)[used_vertices] if normals is not None else None
+
+    return np.asarray(vertices)[used_vertices], faces.reshape(-1, 3), kept_normals
+
+
+def write_mesh(path: str, vertices: np.ndarray, faces: np.ndarray, normals: np.ndarray = None, compact: bool = True):
+    """
+    Write a mesh to a binary PLY, binary STL or OBJ file, by the file extension.
+
+    :param path: Path of the mesh file.
+    :param vertices: Array of the vertices, such as the coordinates of a point cloud.
+    :param faces: Array of faces, as rows of 3 vertex indices, such as point ids.
+    :param normals: Array of the vertex normals, or None. STL files have no vertex normals.
+    :param compact: Whether to drop the vertices that are not in any face.
+    """
+    if compact:
+        vertices, faces, normals = compact_mesh(vertices, faces, normals)
+
+    with MeshWriter(path, vertices, normals) as writer:
+        writer.write_faces(faces)
+
+
+def write_mesh_batches(path: str, vertices: np.ndarray, batches, normals: np.ndarray = None) -> int:
+    """
+    Write a mesh while it is made, from batches of faces, such as the ones BPA.iter_mesh(batch_size=...) yields. All
+    the vertices are written, since the faces are not known in advance.
+
+    :param path: Path of the mesh file.
+    :param vertices: Array of the vertices.
+    :param batches: Iterable of arrays of faces, as rows of 3 vertex indices.
+    :param normals: Array of the vertex normals, or None.
+    :return: Number of faces written.
+    """
+    with MeshWriter(path, vertices, normals) as writer:
+        for faces in batches:
+            writer.write_faces(faces)
+
+        return writer.num_faces
@@ -0,0 +1,303 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from spatial_grid import Grid
+from point import PointCloud
+
+# Number of points whose normals are solved at a time. Bounds the memory of the neighbourhoods block.
+NORMALS_CHUNK_SIZE = 1 << 18
+
+# Number of query and candidate pairs the nearest neighbours search measures at a time.
+KNN_BATCH_SIZE = 1 << 21
+
+# Steps per unit of the weights of the links the normals are oriented along. Weights are at most 2, and fit 16 bits.
+LINK_WEIGHT_SCALE = 1 << 14
+
+
+def gather_ranges(starts: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate ranges of positions in one gather.
+
+    :param starts: Array of the first position of each range.
+    :param lengths: Array of the length of each range.
+    :return: Array of all the positions, and array of where each range starts in it.
+    """
+    ends = np.cumsum(lengths)
+    range_starts = ends - lengths
+    total = int(ends[-1]) if len(ends) else 0
+    return np.arange(total) + np.repeat(starts - range_starts, lengths), range_starts
+
+
+def find_nearest_neighbors(coordinates: np.ndarray, k: int) -> np.ndarray:
+    """
+    Find the k nearest neighbours of every point, the point itself included, over a spatial grid. The points of each
+    cell are matched against the points of the cells around it, and cells with about the same number of candidates are
+    batched into one padded distance array. Points whose k-th neighbour is farther than a cell might have closer
+    neighbours out of those cells, so they are searched again on a grid with cells twice as large.
+
+    :param coordinates: N x 3 array of the points coordinates.
+    :param k: Number of neighbours.
+    :return: N x k array of the neighbours ids, from the nearest.
+    """
+    cloud = PointCloud(coordinates)
+    coordinates = cloud.coordinates
+    num_points = len(cloud)
+    k = min(k, num_points)
+    neighbors = np.empty((num_points, k), dtype=np.int64)
+
+    # Guess a cell with about k points, as if the points were spread evenly on a surface of a few bounding box faces.
+    bounding_box_size = float(np.max(coordinates.max(axis=0) - coordinates.min(axis=0))) if num_points else 0.0
+    radius = max(bounding_box_size * np.sqrt(4 * k / max(num_points, 1)) / 2, bounding_box_size / 2 ** 20, 1e-12)
+    pending = np.arange(num_points)
+
+    while len(pending) > 0:
+        grid = Grid(radius=radius, points=cloud)
+
+        # Group the pending points by cell.
+        pending = pending[np.argsort(grid.point_cells[pending], kind="stable")]
+        cells, query_starts, query_counts = np.unique(grid.point_cells[pending], return_index=True,
+                                                      return_counts=True)
+
+        # Count the candidates of each cell: the points of the cell and of the cells around it.
+        neighbor_starts = grid.neighbor_offsets[cells]
+        neighbor_positions, neighbor_range_starts = gather_ranges(neighbor_starts,
+                                                                  grid.neighbor_offsets[cells + 1] - neighbor_starts)
+        neighbor_cells = grid.neighbor_cells[neighbor_positions]
+        neighbor_sizes = grid.cell_offsets[neighbor_cells + 1] - grid.cell_offsets[neighbor_cells]
+        candidate_counts = np.add.reduceat(neighbor_sizes, neighbor_range_starts)
+
+        # Cells with too few candidates wait for larger cells.
+        unresolved = [pending[gather_ranges(query_starts[candidate_counts < k],
+                                            query_counts[candidate_counts < k])[0]]]
+        batch_order = np.flatnonzero(candidate_counts >= k)
+        batch_order = batch_order[np.argsort(candidate_counts[batch_order], kind="stable")]
+
+        start = 0
+
+        while start < len(batch_order):
+            # Take cells, with growing numbers of candidates, until the padded distance array is large enough.
+            end, max_queries = start, 0
+
+            while end < len(batch_order):
+                max_queries = max(max_queries, int(query_counts[batch_order[end]]))
+
+                if end > start and (end - start + 1) * max_queries * candidate_counts[batch_order[end]] > \
+                        KNN_BATCH_SIZE:
+                    break
+
+                end += 1
+
+            batch = batch_order[start:end]
+            start = end
+
+            # Candidates of the batch's cells, padded to the same count.
+            batch_neighbor_positions, batch_neighbor_starts = gather_ranges(
+                neighbor_range_starts[batch], np.diff(np.append(neighbor_range_starts, len(neighbor_cells)))[batch])
+            batch_cells = neighbor_cells[batch_neighbor_positions]
+            cell_starts = grid.cell_offsets[batch_cells]
+            candidate_positions, _ = gather_ranges(cell_starts, grid.cell_offsets[batch_cells + 1] - cell_starts)
+            candidates = grid.cell_points[candidate_positions]
+
+            counts = candidate_counts[batch]
+            columns = np.arange(counts.max())
+            is_candidate = columns < counts[:, None]
+            candidate_grid = candidates[np.minimum((np.cumsum(counts) - counts)[:, None] + columns,
+                                                   len(candidates) - 1)]
+
+            rows = np.arange(query_counts[batch].max())
+            is_query = rows < query_counts[batch][:, None]
+            query_grid = pending[np.minimum(query_starts[batch][:, None] + rows, len(pending) - 1)]
+
+            # Squared distances as |q|^2 + |c|^2 - 2 q.c, with the padding candidates infinitely far.
+            query_coordinates = coordinates[query_grid].astype(np.float64)
+            candidate_coordinates = coordinates[candidate_grid].astype(np.float64)
+            candidate_norms = np.einsum("bci,bci->bc", candidate_coordinates, candidate_coordinates)
+            candidate_norms[~is_candidate] = np.inf
+            dists = np.matmul(query_coordinates, candidate_coordinates.transpose(0, 2, 1))
+            dists *= -2
+            dists += candidate_norms[:, None, :]
+            dists += np.einsum("bqi,bqi->bq", query_coordinates, query_coordinates)[:, :, None]
+
+            nearest = np.argpartition(dists, k - 1, axis=2)[:, :, :k]
+            nearest_dists = np.take_along_axis(dists, nearest, axis=2)
+            nearest = np.take_along_axis(nearest, np.argsort(nearest_dists, axis=2, kind="stable"), axis=2)
+            nearest_ids = np.take_along_axis(np.broadcast_to(candidate_grid[:, None, :], dists.shape), nearest, axis=2)
+
+            neighbors[query_grid[is_query]] = nearest_ids[is_query]
+
+            # The cells around a point cover every point within a cell size of it.
+            is_exact = nearest_dists.max(axis=2) <= grid.cell_size ** 2
+            unresolved.append(query_grid[is_query & ~is_exact])
+
+        pending = np.concatenate(unresolved)
+        radius *= 2
+
+    return neighbors
+
+
+def solve_normals(neighborhoods: np.ndarray) -> np.ndarray:
+    """
+    Find the normal of each neighbourhood, as the direction its points spread the least in: the eigenvector of the
+    smallest eigenvalue of their covariance matrix. The 3 x 3 eigenproblems are solved in closed form, all at once.
+
+    :param neighborhoods: N x k x 3 array of the coordinates of each point's neighbours.
+    :return: N x 3 array of unit normals, not oriented.
+    """
+    centered = neighborhoods - neighborhoods.mean(axis=1, keepdims=True)
+    covariances = np.einsum("nki,nkj->nij", centered, centered)
+
+    # Smallest eigenvalue of each symmetric matrix, by the trigonometric solution of its characteristic polynomial.
+    identity = np.eye(3)
+    q = np.trace(covariances, axis1=1, axis2=2) / 3
+    shifted = covariances - q[:, None, None] * identity
+    p = np.sqrt(np.einsum("nij,nij->n", shifted, shifted) / 6)
+    scaled = np.divide(shifted, p[:, None, None], out=np.zeros_like(shifted), where=p[:, None, None] > 0)
+    angle = np.arccos(np.clip(np.linalg.det(scaled) / 2, -1, 1)) / 3
+    smallest = q + 2 * p * np.cos(angle + 2 * np.pi / 3)
+
+    # The eigenvector is orthogonal to the rows of (covariance - eigenvalue * I). Take the longest cross product of
+    # two rows, which is the most accurate one.
+    rows = covariances - smallest[:, None, None] * identity
+    crosses = np.stack((np.cross(rows[:, 0], rows[:, 1]), np.cross(rows[:, 0], rows[:, 2]),
+                        np.cross(rows[:, 1], rows[:, 2])), axis=1)
+    lengths = np.linalg.norm(crosses, axis=2)
+    best = np.argmax(lengths, axis=1)
+    normals = crosses[np.arange(len(crosses)), best]
+    best_lengths = lengths[np.arange(len(crosses)), best]
+
+    # Flat neighbourhoods, where the rows are parallel, have no single direction. Fall back to the general solver.
+    is_degenerate = best_lengths <= 1e-12 * np.maximum(q, 1e-300) ** 2
+    normals[~is_degenerate] /= best_lengths[~is_degenerate, None]
+
+    if np.any(is_degenerate):
+        normals[is_degenerate] = np.linalg.eigh(covariances[is_degenerate])[1][:, :, 0]
+
+    return normals
+
+
+def orient_normals(coordinates: np.ndarray, normals: np.ndarray, neighbors: np.ndarray) -> np.ndarray:
+    """
+    Orient the normals consistently, as Hoppe et al. do: along the minimum spanning tree of the neighbours graph, with
+    each link weighted by 1 - |ni . nj|. The tree takes the most parallel neighbours first, so the orientation does not
+    jump across sharp edges. Neighbours on the two sides of a thin part have parallel normals too, so the weight also
+    grows with how much the link runs along the normals, away from the surface. The first point of each connected part
+    is the one farthest from the cloud's centre, and its normal points away from the centre.
+
+    The tree is built by Boruvka's algorithm, a whole round of merges at once: each part of the cloud takes its lightest
+    link to another part, and is flipped as a whole if its normals disagree with the normals across that link.
+
+    :param coordinates: N x 3 array of the points coordinates.
+    :param normals: N x 3 array of the normals, flipped in place.
+    :param neighbors: N x k array of the neighbours of each point.
+    :return: The normals.
+    """
+    num_points = len(coordinates)
+    points = np.arange(num_points)
+
+    # The weight of each point's link to each of its neighbours, in steps of 1 / LINK_WEIGHT_SCALE, so that the links
+    # are sorted by a radix sort.
+    weights = np.empty(neighbors.shape, dtype=np.uint16)
+    unit_normals = normals.astype(np.float32)
+
+    for start in range(0, num_points, NORMALS_CHUNK_SIZE):
+        chunk = slice(start, start + NORMALS_CHUNK_SIZE)
+        chunk_normals = unit_normals[chunk, None, :]
+        neighbor_normals = unit_normals[neighbors[chunk]]
+        directions = coordinates[neighbors[chunk]] - coordinates[chunk, None, :]
+        directions /= np.maximum(np.linalg.norm(directions, axis=2, keepdims=True), 1e-30)
+        chunk_weights = 1 - np.abs(np.einsum("nki,nki->nk", neighbor_normals, chunk_normals))
+        chunk_weights += (np.abs(np.einsum("nki,nki->nk", chunk_normals, directions)) +
+                          np.abs(np.einsum("nki,nki->nk", neighbor_normals, directions))) / 2
+        weights[chunk] = np.rint(np.clip(chunk_weights, 0, 2) * LINK_WEIGHT_SCALE)
+
+    # The links, lightest first. Links of a point to itself are dropped.
+    links = np.flatnonzero(neighbors != points[:, None])
+    links = links[np.argsort(weights.ravel()[links], kind="stable")]
+    sources, targets = links // neighbors.shape[1], neighbors.ravel()[links]
+
+    # Each point's part, named by one of its points.
+    parts = points.copy()
+
+    while True:
+        # Drop the links inside a part. The parts only grow, so they never link two parts again.
+        source_parts, target_parts = parts[sources], parts[targets]
+        is_between = source_parts != target_parts
+        sources, targets = sources[is_between], targets[is_between]
+        source_parts, target_parts = source_parts[is_between], target_parts[is_between]
+
+        if len(sources) == 0:
+            break
+
+        # The lightest link of each part: the first in order. Links of equal weight are taken in their sorted order.
+        link_numbers = np.arange(len(sources))
+        lightest = np.full(num_points, len(sources))
+        np.minimum.at(lightest, source_parts, link_numbers)
+        np.minimum.at(lightest, target_parts, link_numbers)
+        merged = np.flatnonzero(lightest < len(sources))
+        links = lightest[merged]
+
+        # Each part joins the part across its link, and is flipped if the normals across the link disagree.
+        parents = points.copy()
+        parents[merged] = np.where(source_parts[links] == merged, target_parts[links], source_parts[links])
+        flips = np.zeros(num_points, dtype=bool)
+        flips[merged] = np.einsum("ij,ij->i", normals[sources[links]], normals[targets[links]]) < 0
+
+        # Two parts that took the same link join the one with the smaller name.
+        is_root = (parents[parents] == points) & (points < parents)
+        parents[is_root] = points[is_root]
+        flips[is_root] = False
+
+        # Follow the joins to the root of each tree, adding up the flips on the way.
+        while np.any(parents[parents] != parents):
+            flips ^= flips[parents]
+            parents = parents[parents]
+
+        normals[flips[parts]] *= -1
+        parts = parents[parts]
+
+    # Point the normal of the farthest point of each part away from the centre, and the rest of its part along.
+    outward = coordinates - coordinates.mean(axis=0)
+    start_order = np.argsort(-np.einsum("ij,ij->i", outward, outward), kind="stable")
+    _, first = np.unique(parts[start_order], return_index=True)
+    starts = start_order[first]
+    flips = np.zeros(num_points, dtype=bool)
+    flips[parts[starts]] = np.einsum("ij,ij->i", normals[starts], outward[starts]) < 0
+    normals[flips[parts]] *= -1
+
+    return normals
+
+
+def estimate_normals(coordinates: np.ndarray, k: int = 16, num_workers: int = 1) -> np.ndarray:
+    """
+    Estimate the normals of a point cloud from the k nearest neighbours of each point, and orient them consistently.
+
+    :param coordinates: N x 3 array of the points coordinates.
+    :param k: Number of neighbours to fit each normal to.
+    :param num_workers: Number of processes to solve the normals with.
+    :return: N x 3 float32 array of unit normals.
+    """
+    coordinates = np.ascontiguousarray(coordinates, dtype=np.float32).reshape(-1, 3)
+
+    if len(coordinates) < 3:
+        return np.zeros_like(coordinates)
+
+    neighbors = find_nearest_neighbors(coordinates, k)
+    chunks = (coordinates[neighbors[start:start + NORMALS_CHUNK_SIZE]].astype(np.float64)
+              for start in range(0, len(coordinates), NORMALS_CHUNK_SIZE))
+
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            normals = np.concatenate(list(executor.map(solve_normals, chunks)))
+    else:
+        normals = np.concatenate([solve_normals(chunk) for chunk in chunks])
+
+    return orient_normals(coordinates, normals, neighbors).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import sys
+    from point_io import read_points, write_text_points
+
+    # Estimate the normals of a point cloud file: python normal_estimation.py input output.txt [k]
+    points = read_points(sys.argv[1])
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    write_text_points(sys.argv[2], PointCloud(points.coordinates, estimate_normals(points.coordinates, k)))
@@ -0,0 +1,333 @@
+import hashlib
+import os
+import numpy as np
+from point import PointCloud
+
+# Bytes read from a text file at a time. Parsing keeps a few arrays of the chunk's size, so this bounds the loader's
+# memory.
+CHUNK_SIZE = 1 << 24
+
+# Binary point cloud file: a header, then the float32 coordinates block, then the float32 normals block.
+BINARY_EXTENSION = ".bpc"
+BINARY_MAGIC = b"BPACLOUD"
+BINARY_VERSION = 1
+BINARY_HEADER = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("reserved", "<u4"),
+    ("num_points", "<u8"),
+    ("source_mtime_ns", "<i8"),  # Modification time of the file the cloud was converted from, 0 if unknown.
+])
+
+# Converted clouds are cached here, one binary file per source path.
+CACHE_DIR = os.environ.get("BPA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bpa"))
+
+
+def parse_text_chunk(chunk: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parse whole lines of a point cloud text file. Lines with 3 values are points without a normal, lines with 6 values
+    are points with a normal, and every other line is skipped.
+
+    :param chunk: Bytes of one or more whole lines.
+    :return: Coordinates array and normals array. Points without a normal get a zero normal.
+    """
+    buffer = np.frombuffer(chunk, dtype=np.uint8)
+
+    if len(buffer) == 0:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.float32)
+
+    # Spaces, tabs and line breaks are all at or below the space character.
+    is_space = buffer <= ord(" ")
+
+    # A value starts at a non whitespace byte that follows a whitespace byte (or the start of the chunk).
+    value_starts = np.empty_like(is_space)
+    value_starts[0] = not is_space[0]
+    np.greater(is_space[:-1], is_space[1:], out=value_starts[1:])
+
+    # Bounds of the lines. Each line includes its newline byte.
+    line_bounds = np.flatnonzero(buffer == ord("\n")) + 1
+
+    if len(line_bounds) == 0 or line_bounds[-1] != len(buffer):
+        line_bounds = np.append(line_bounds, len(buffer))
+
+    line_starts = np.concatenate(([0], line_bounds[:-1]))
+    line_lengths = line_bounds - line_starts
+
+    # Count the values of each line.
+    values_per_line = np.add.reduceat(value_starts.view(np.uint8), line_starts, dtype=np.int32)
+
+    # Parse the values of the valid lines in one call.
+    is_valid_line = (values_per_line == 3) | (values_per_line == 6)
+    values_per_line = values_per_line[is_valid_line]
+
+    if is_valid_line.all():
+        valid_bytes = chunk
+    else:
+        valid_bytes = buffer[np.repeat(is_valid_line, line_lengths)].tobytes()
+
+    values = np.fromstring(valid_bytes, sep=" ") if len(valid_bytes) else np.empty(0)
+
+    if len(values) != values_per_line.sum():
+        raise ValueError("Point cloud file has a line with values that are not numbers.")
+
+    # Gather the coordinates and normals of each line from the flat values.
+    value_offsets = np.cumsum(values_per_line) - values_per_line
+    coordinates = values[value_offsets[:, None] + np.arange(3)]
+    normals = np.zeros_like(coordinates)
+    has_normal = values_per_line == 6
+    normals[has_normal] = values[value_offsets[has_normal, None] + np.arange(3, 6)]
+
+    return coordinates.astype(np.float32), normals.astype(np.float32)
+
+
+def read_text_points(path: str) -> PointCloud:
+    """
+    Read a point cloud from a text file with one point per line, as "x y z" or "x y z nx ny nz".
+    The points are sorted by x, then y, then z.
+
+    :param path: Path of the text file.
+    :return: The point cloud.
+    """
+    all_coordinates = []
+    all_normals = []
+    remainder = b""
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            # Keep the last, possibly partial, line for the next chunk.
+            chunk = remainder + chunk
+            last_newline = chunk.rfind(b"\n")
+
+            if last_newline < 0:
+                remainder = chunk
+                continue
+
+            remainder = chunk[last_newline + 1:]
+            coordinates, normals = parse_text_chunk(chunk[:last_newline + 1])
+            all_coordinates.append(coordinates)
+            all_normals.append(normals)
+
+    coordinates, normals = parse_text_chunk(remainder)
+    all_coordinates.append(coordinates)
+    all_normals.append(normals)
+
+    return sort_points(np.concatenate(all_coordinates), np.concatenate(all_normals))
+
+
+def sort_points(coordinates: np.ndarray, normals: np.ndarray) -> PointCloud:
+    """
+    Sort points by x, then y, then z. Sorting the points can lead to better seed triangle picking, and streaming.py
+    meshes sorted clouds slab by slab.
+
+    :param coordinates: N x 3 array of the coordinates.
+    :param normals: N x 3 array of the normals.
+    :return: The sorted point cloud.
+    """
+    order = np.argsort(coordinates[:, 0], kind="stable")
+    sorted_x = coordinates[order, 0]
+
+    # Break ties in x by y and then by z, only if there are any.
+    if np.any(sorted_x[1:] == sorted_x[:-1]):
+        order = np.lexsort((coordinates[:, 2], coordinates[:, 1], coordinates[:, 0]))
+
+    return PointCloud(coordinates[order], normals[order])
+
+
+def read_obj_points(path: str) -> PointCloud:
+    """
+    Read the vertices of an OBJ model as a point cloud. Each vertex gets the normal of the first facet it is in, and
+    vertices that are not in any facet are dropped.
+    Models are taken from here: https://github.com/alecjacobson/common-3d-test-models
+
+    :param path: Path of the OBJ file.
+    :return: The point cloud, sorted as sort_points sorts it.
+    """
+    vertices = []
+    facets = []
+
+    with open(path, "r") as f:
+        for line in f:
+            splitted = line.split()
+
+            if len(splitted) < 4:
+                continue
+
+            if splitted[0] == "v":  # Parse vertex lines
+                vertices.append([float(splitted[1]), float(splitted[2]), float(splitted[3])])
+            elif splitted[0] == "f":  # Parse facet lines
+                try:
+                    # Extract only vertex indices before the '/' character
+                    facets.append([int(part.split("/")[0]) - 1 for part in splitted[1:4]])
+                except ValueError:
+                    print(f"Malformed facet line: {line}")
+
+    vertices = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+    facets = np.array(facets, dtype=np.int64).reshape(-1, 3)
+
+    # Calculate the normal of each facet.
+    p1, p2, p3 = vertices[facets[:, 0]], vertices[facets[:, 1]], vertices[facets[:, 2]]
+    facet_normals = np.cross(p2 - p1, p3 - p1)
+    facet_normals /= np.linalg.norm(facet_normals, axis=1, keepdims=True)
+
+    # Find the first facet of each vertex.
+    used_vertices, first_occurrence = np.unique(facets.ravel(), return_index=True)
+
+    return sort_points(vertices[used_vertices], facet_normals[first_occurrence // 3])
+
+
+def write_text_points(path: str, points: PointCloud):
+    """
+    Write a point cloud to a text file with one "x y z nx ny nz" line per point.
+
+    :param path: Path of the text file.
+    :param points: The point cloud.
+    """
+    np.savetxt(path, np.hstack((points.coordinates, points.normals)), fmt="%.9g")
+
+
+def write_binary_points(path: str, points: PointCloud, source_mtime_ns: int = 0):
+    """
+    Write a point cloud to a binary file. The file is written next to its final path and then renamed, so readers
+    never see a partial file.
+
+    :param path: Path of the binary file.
+    :param points: The point cloud.
+    :param source_mtime_ns: Modification time of the file the cloud was converted from.
+    """
+    header = np.zeros(1, dtype=BINARY_HEADER)
+    header["magic"] = BINARY_MAGIC
+    header["version"] = BINARY_VERSION
+    header["num_points"] = len(points)
+    header["source_mtime_ns"] = source_mtime_ns
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temp_path, "wb") as f:
+        header.tofile(f)
+        np.ascontiguousarray(points.coordinates, dtype="<f4").tofile(f)
+        np.ascontiguousarray(points.normals, dtype="<f4").tofile(f)
+
+    os.replace(temp_path, path)
+
+
+def read_binary_header(path: str) -> np.ndarray:
+    """
+    Read and validate the header of a binary point cloud file.
+
+    :param path: Path of the binary file.
+    :return: The header record.
+    """
+    header = np.fromfile(path, dtype=BINARY_HEADER, count=1)
+
+    if len(header) == 0 or header["magic"][0] != BINARY_MAGIC or header["version"][0] != BINARY_VERSION:
+        raise ValueError(f"{path} is not a binary point cloud file.")
+
+    return header[0]
+
+
+def open_binary_points(path: str) -> PointCloud:
+    """
+    Open a binary point cloud file. The coordinates and normals are memory-mapped, not read into memory.
+
+    :param path: Path of the binary file.
+    :return: The point cloud.
+    """
+    num_points = int(read_binary_header(path)["num_points"])
+    block_size = num_points * 3 * 4
+
+    if num_points == 0:
+        return PointCloud(np.empty((0, 3), dtype=np.float32))
+
+    coordinates = np.memmap(path, dtype="<f4", mode="r", offset=BINARY_HEADER.itemsize, shape=(num_points, 3))
+    normals = np.memmap(path, dtype="<f4", mode="r", offset=BINARY_HEADER.itemsize + block_size,
+                        shape=(num_points, 3))
+
+    return PointCloud(coordinates, normals)
+
+
+def read_points(path: str) -> PointCloud:
+    """
+    Read a point cloud from a text, OBJ or binary file, by the file extension.
+
+    :param path: Path of the file.
+    :return: The point cloud.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == BINARY_EXTENSION:
+        return open_binary_points(path)
+    elif extension == ".obj":
+        return read_obj_points(path)
+
+    return read_text_points(path)
+
+
+def get_cache_path(path: str, cache_dir: str = None) -> str:
+    """
+    Find the path of the cached binary file of a point cloud file.
+
+    :param path: Path of the point cloud file.
+    :param cache_dir: Cache directory. Defaults to CACHE_DIR.
+    :return: Path of the cached binary file.
+    """
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(cache_dir or CACHE_DIR, key + BINARY_EXTENSION)
+
+
+def convert_points(path: str, cache_dir: str = None) -> str:
+    """
+    Convert a point cloud file to the binary format, unless the cache already has an up to date conversion.
+    The cached file is up to date if it was converted from the current modification time of the source file.
+
+    :param path: Path of the text or OBJ point cloud file.
+    :param cache_dir: Cache directory. Defaults to CACHE_DIR.
+    :return: Path of the cached binary file.
+    """
+    cache_path = get_cache_path(path, cache_dir)
+    source_mtime_ns = os.stat(path).st_mtime_ns
+
+    if os.path.exists(cache_path):
+        try:
+            if read_binary_header(cache_path)["source_mtime_ns"] == source_mtime_ns:
+                return cache_path
+        except ValueError:
+            pass
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    write_binary_points(cache_path, read_points(path), source_mtime_ns=source_mtime_ns)
+    return cache_path
+
+
+def load_points(path: str, cache_dir: str = None, use_cache: bool = True) -> PointCloud:
+    """
+    Load a point cloud through the binary cache. Text and OBJ files are converted once, and later loads memory-map
+    the converted file. If the cache can not be written, the file is read directly.
+
+    :param path: Path of the point cloud file.
+    :param cache_dir: Cache directory. Defaults to CACHE_DIR.
+    :param use_cache: Whether to use the cache at all.
+    :return: The point cloud.
+    """
+    if not use_cache or os.path.splitext(path)[1].lower() == BINARY_EXTENSION:
+        return read_points(path)
+
+    try:
+        cache_path = convert_points(path, cache_dir)
+    except OSError:
+        return read_points(path)
+
+    return open_binary_points(cache_path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Convert point cloud files to the binary format: python point_io.py input.txt [output.bpc]
+    input_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(input_path)[0] + BINARY_EXTENSION
+    write_binary_points(output_path, read_points(input_path), source_mtime_ns=os.stat(input_path).st_mtime_ns)
@@ -0,0 +1,686 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from ball_pivoting_algo import BPA, fill_missing_normals
+from Holefilling import MESH_BATCH_SIZE, mesh_radii
+from point import PointCloud
+from point_io import load_points
+from spatial_grid import Grid
+
+# Number of clouds each worker keeps, with the grids built for them.
+CACHE_SIZE = 4
+
+# Number of grids, one per radius, each cached cloud keeps.
+GRIDS_PER_CLOUD = 4
+
+# Largest request body the service reads, in bytes.
+MAX_BODY_SIZE = 1 << 30
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class CloudCache:
+    """
+    Least recently used cache of a worker's clouds, keyed by the file's path and modification time. Each cloud keeps
+    the grids built for its most recently used radii, so a job on a cached cloud skips both loading and building the cells.
+    Uploaded clouds are not cached.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        # Key -> (PointCloud, dictionary of radius -> Grid). The grids are in least recently used order too.
+        self.entries = OrderedDict()
+
+    def get(self, request: dict, radius: float) -> tuple[PointCloud, Grid, bool]:
+        """
+        Find the cloud of a job, and the grid for its first radius.
+
+        :param request: The job's request.
+        :param radius: Radius of the grid.
+        :return: A cloud and a grid with an empty mesh for the job, and whether the cloud was cached.
+        """
+        key = get_cloud_key(request)
+
+        if key is None:
+            return read_uploaded_points(request), None, False
+
+        is_hit = key in self.entries
+
+        if is_hit:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = (fill_missing_normals(load_points(request["path"])), OrderedDict())
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        cloud, grids = self.entries[key]
+
+        if radius in grids:
+            grids.move_to_end(radius)
+        else:
+            # The cached grid has a cloud of its own, since building a grid writes the cell codes of its points.
+            grids[radius] = Grid(radius=radius, points=PointCloud(cloud.coordinates, cloud.normals))
+
+            while len(grids) > GRIDS_PER_CLOUD:
+                grids.popitem(last=False)
+
+        # Each job gets fresh point flags and an empty mesh.
+        points = PointCloud(cloud.coordinates, cloud.normals)
+        return points, grids[radius].copy_cells(points), is_hit
+
+
+class PipeCancel:
+    """
+    Tells a running job that the service cancelled it, by a ("cancel", job id, None) message on the worker's
+    connection. Has the is_set() method BPA.iter_mesh checks. Other messages are kept in the worker's inbox for its
+    main loop, and a None message, which asks the worker to exit, cancels the job as well.
+    """
+
+    def __init__(self, connection, job_id: int, inbox: deque):
+        self.connection = connection
+        self.job_id = job_id
+        self.inbox = inbox
+        self.is_cancelled = False
+
+    def is_set(self) -> bool:
+        while not self.is_cancelled and self.connection.poll():
+            message = self.connection.recv()
+
+            if message is not None and message[0] == "cancel":
+                # Cancel messages of jobs that already finished are dropped.
+                self.is_cancelled = message[1] == self.job_id
+            else:
+                self.inbox.append(message)
+                self.is_cancelled = message is None
+
+        return self.is_cancelled
+
+
+def get_cloud_key(request: dict):
+    """
+    Find the cache key of a job's cloud.
+
+    :param request: The job's request.
+    :return: (absolute path, modification time) of the cloud file, or None for an uploaded cloud.
+    """
+    if "path" not in request:
+        return None
+
+    path = os.path.abspath(request["path"])
+    return path, os.stat(path).st_mtime_ns
+
+
+def decode_array(text: str) -> np.ndarray:
+    """
+    Decode an uploaded array: base64 of little endian float32 values, 3 per point.
+
+    :param text: The base64 text.
+    :return: N x 3 array.
+    """
+    data = base64.b64decode(text, validate=True)
+
+    if len(data) % 12 != 0:
+        raise ValueError("Uploaded arrays must have 3 float32 values per point.")
+
+    return np.frombuffer(data, dtype="<f4").reshape(-1, 3)
+
+
+def read_uploaded_points(request: dict) -> PointCloud:
+    """
+    Make the cloud of a job that uploaded its points.
+
+    :param request: The job's request, with "coordinates" and optionally "normals" (see decode_array).
+    :return: The point cloud. Missing normals are estimated.
+    """
+    coordinates = decode_array(request["coordinates"])
+    normals = decode_array(request["normals"]) if "normals" in request else None
+
+    if normals is not None and len(normals) != len(coordinates):
+        raise ValueError("Uploaded normals must have one normal per point.")
+
+    return fill_missing_normals(PointCloud(coordinates, normals))
+
+
+def run_job(connection, job_id: int, request: dict, cache: CloudCache, cancel: PipeCancel):
+    """
+    Mesh a job's cloud in a worker process, and send its triangles to the service as they are made. The job stops
+    when its time budget runs out or the service cancels it.
+
+    :param connection: Connection to the service.
+    :param job_id: Id of the job.
+    :param request: The job's request.
+    :param cache: The worker's cloud cache.
+    :param cancel: The job's PipeCancel.
+    """
+    start = time.perf_counter()
+    radii = request["radii"]
+    time_budget = request.get("time_budget")
+    num_triangles = 0
+
+    def send_triangles(triangles: np.ndarray):
+        nonlocal num_triangles
+        connection.send(("triangles", job_id, triangles))
+        num_triangles += len(triangles)
+
+    points, grid, is_cache_hit = cache.get(request, radii[0])
+    bpa = BPA(None, radii[0], points=points, grid=grid)
+    times = {"load": time.perf_counter() - start}
+
+    status, mesh_times, num_unfilled_holes = mesh_radii(
+        bpa, radii, request.get("limit_iterations", np.inf), max_hole_size=request.get("max_hole_size", 0),
+        time_budget=None if time_budget is None else max(time_budget - times["load"], 0), cancel=cancel,
+        on_triangles=send_triangles, batch_size=request.get("batch_size", MESH_BATCH_SIZE))
+    times.update(mesh_times)
+
+    connection.send(("done", job_id, {
+        "status": status,
+        "num_points": len(bpa.points),
+        "num_triangles": num_triangles,
+        "num_unfilled_holes": num_unfilled_holes,
+        "cache_hit": is_cache_hit,
+        "times": times,
+        "total_time": time.perf_counter() - start,
+        "worker": os.getpid(),
+    }))
+
+
+def worker_main(connection, cache_size: int):
+    """
+    Main loop of a worker process: run the jobs the service sends, one at a time, until it sends None.
+
+    :param connection: Connection to the service.
+    :param cache_size: Number of clouds to cache.
+    """
+    cache = CloudCache(cache_size)
+
+    # Messages a job read while it ran, for this loop.
+    inbox = deque()
+
+    while True:
+        message = inbox.popleft() if inbox else connection.recv()
+
+        if message is None:
+            return
+
+        kind, job_id, request = message
+
+        # A cancel message of a job that already finished.
+        if kind != "job":
+            continue
+
+        try:
+            run_job(connection, job_id, request, cache, PipeCancel(connection, job_id, inbox))
+        except Exception as error:
+            connection.send(("error", job_id, repr(error)))
+
+
+class Job:
+    """
+    A job of the service: its request, and the messages of its worker, which the connection that submitted it reads.
+    """
+
+    def __init__(self, job_id: int, request: dict):
+        self.id = job_id
+        self.request = request
+        self.cloud_key = get_cloud_key(request)
+        self.messages = asyncio.Queue()
+        self.worker = None
+        self.is_cancelled = False
+
+
+class Worker:
+    """
+    A worker process of the service, and the keys of the clouds it has cached, in least recently used order. The keys
+    follow the worker's CloudCache, so jobs can be sent to the worker that has their cloud.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self.cloud_keys = OrderedDict()
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_main, args=(worker_connection, cache_size), daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+    def touch(self, cloud_key):
+        """
+        Record that the worker used a cloud.
+
+        :param cloud_key: Key of the cloud, or None for an uploaded cloud.
+        """
+        if cloud_key is None:
+            return
+
+        self.cloud_keys[cloud_key] = True
+        self.cloud_keys.move_to_end(cloud_key)
+
+        while len(self.cloud_keys) > self.cache_size:
+            self.cloud_keys.popitem(last=False)
+
+    def stop(self):
+        """
+        Ask the worker process to exit, and wait for it.
+        """
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+
+        self.process.join(timeout=5)
+        self.process.kill()
+        self.connection.close()
+
+
+class MeshingService:
+    """
+    Meshing service: a queue of jobs, run by warm worker processes that keep the clouds they loaded. Jobs go, oldest
+    first, to an idle worker that has their cloud cached, or else to any idle worker.
+    """
+
+    def __init__(self, num_workers: int, cache_size: int = CACHE_SIZE):
+        self.num_workers = num_workers
+        self.cache_size = cache_size
+        self.workers = []
+        self.tasks = []
+        self.pending = deque()
+        self.idle = []  # Indices of the workers waiting for a job, in the order they became idle.
+        self.assigned = []  # Queue of the job sent to each worker.
+        self.job_ids = itertools.count()
+        self.num_running = 0
+
+    async def start(self):
+        """
+        Start the worker processes, and the tasks that feed them jobs.
+        """
+        self.workers = [Worker(self.cache_size) for _ in range(self.num_workers)]
+        self.assigned = [asyncio.Queue() for _ in range(self.num_workers)]
+        self.tasks = [asyncio.create_task(self.run_worker(i)) for i in range(self.num_workers)]
+
+    def stop(self):
+        """
+        Stop the worker processes.
+        """
+        for task in self.tasks:
+            task.cancel()
+
+        for worker in self.workers:
+            worker.stop()
+
+    def dispatch(self):
+        """
+        Hand the pending jobs to the idle workers. A job goes to an idle worker that has its cloud cached, if there is
+        one, and only then to another idle worker, so a worker does not load a cloud another idle worker has.
+        """
+        # Jobs of clouds an idle worker has cached.
+        for job in list(self.pending):
+            if job.cloud_key is None:
+                continue
+
+            index = next((i for i in self.idle if job.cloud_key in self.workers[i].cloud_keys), None)
+
+            if index is not None:
+                self.assign(job, index)
+
+        # The other jobs, oldest first.
+        while self.pending and self.idle:
+            self.assign(self.pending[0], self.idle[0])
+
+    def assign(self, job: Job, index: int):
+        """
+        Send a pending job to an idle worker.
+
+        :param job: The job.
+        :param index: Index of the worker.
+        """
+        self.pending.remove(job)
+        self.idle.remove(index)
+        self.assigned[index].put_nowait(job)
+
+    async def run_worker(self, index: int):
+        """
+        Feed jobs to a worker, and pass the worker's messages to the jobs. A worker process that dies fails its job and
+        is started again.
+
+        :param index: Index of the worker.
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self.idle.append(index)
+            self.dispatch()
+            job = await self.assigned[index].get()
+
+            # The job was cancelled before the worker got it.
+            if job.is_cancelled:
+                continue
+
+            worker = self.workers[index]
+            job.worker = worker
+            self.num_running += 1
+
+            try:
+                worker.connection.send(("job", job.id, job.request))
+
+                while True:
+                    kind, job_id, payload = await loop.run_in_executor(None, worker.connection.recv)
+
+                    if job_id != job.id:
+                        continue
+
+                    await job.messages.put((kind, payload))
+
+                    if kind in ("done", "error"):
+                        break
+
+                # A job that failed, such as on a file that is not a cloud, did not cache its cloud.
+                if kind == "done":
+                    worker.touch(job.cloud_key)
+            except (EOFError, OSError):
+                await job.messages.put(("error", "The worker process died."))
+                worker.stop()
+                self.workers[index] = Worker(self.cache_size)
+            finally:
+                self.num_running -= 1
+
+    async def submit(self, request: dict) -> Job:
+        """
+        Queue a job, and hand it to an idle worker if there is one.
+
+        :param request: The job's request.
+        :return: The job. Read its messages from job.messages.
+        """
+        job = Job(next(self.job_ids), request)
+        self.pending.append(job)
+        self.dispatch()
+
+        return job
+
+    def cancel(self, job: Job):
+        """
+        Cancel a job, such as when its client went away. A running job stops at its next iteration.
+
+        :param job: The job.
+        """
+        job.is_cancelled = True
+
+        if job in self.pending:
+            self.pending.remove(job)
+        elif job.worker is not None:
+            try:
+                job.worker.connection.send(("cancel", job.id, None))
+            except OSError:
+                pass
+
+    def status(self) -> dict:
+        """
+        :return: Dictionary of the number of workers, queued and running jobs, and the clouds each worker has cached.
+        """
+        return {
+            "num_workers": len(self.workers),
+            "num_pending": len(self.pending),
+            "num_running": self.num_running,
+            "cached_clouds": [[key[0] for key in worker.cloud_keys] for worker in self.workers],
+        }
+
+
+def is_number(value) -> bool:
+    """
+    Check if a JSON value is a finite number. true and false are not numbers, and neither are Infinity and NaN, which
+    json.loads accepts.
+
+    :param value: The value.
+    :return: Boolean.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def is_integer(value) -> bool:
+    """
+    Check if a JSON value is an integer, and not true or false.
+
+    :param value: The value.
+    :return: Boolean.
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_request(body: bytes) -> dict:
+    """
+    Parse and check the JSON request of a job:
+    - "path" of a cloud file, or "coordinates" (and optionally "normals") of uploaded points, as base64 little endian
+      float32 values.
+    - "radii": list of ball radii, used in order as in Holefilling.Multiple_Pass.
+    - Optional "limit_iterations" for each radius, "time_budget" in seconds, "max_hole_size" and "batch_size" (see
+      Holefilling.mesh_radii).
+
+    :param body: The request body.
+    :return: The request.
+    :raises ValueError: If the request is not valid, with the reason.
+    """
+    try:
+        request = json.loads(body)
+    except (ValueError, RecursionError) as error:
+        raise ValueError(f"The request is not valid JSON: {error}")
+
+    if not isinstance(request, dict):
+        raise ValueError("The request must be a JSON object.")
+
+    if ("path" in request) == ("coordinates" in request):
+        raise ValueError("The request must have either a \"path\" or \"coordinates\".")
+
+    if "path" in request:
+        if not isinstance(request["path"], str):
+            raise ValueError("\"path\" must be a string.")
+
+        if not os.path.isfile(request["path"]):
+            raise ValueError(f"No point cloud file at {request['path']}.")
+
+    if "coordinates" in request:
+        for name in ("coordinates", "normals"):
+            if name not in request:
+                continue
+
+            if not isinstance(request[name], str):
+                raise ValueError(f"\"{name}\" must be a base64 string.")
+
+            try:
+                decode_array(request[name])
+            except (binascii.Error, ValueError) as error:
+                raise ValueError(f"Bad \"{name}\": {error}")
+
+    radii = request.get("radii")
+
+    if not isinstance(radii, list) or not radii or not all(is_number(r) and r > 0 for r in radii):
+        raise ValueError("The request must have \"radii\", a list of positive numbers.")
+
+    for name in ("limit_iterations", "batch_size"):
+        if name in request and (not is_integer(request[name]) or request[name] <= 0):
+            raise ValueError(f"\"{name}\" must be a positive integer.")
+
+    if "max_hole_size" in request and (not is_integer(request["max_hole_size"]) or request["max_hole_size"] < 0):
+        raise ValueError("\"max_hole_size\" must be a non negative integer.")
+
+    if "time_budget" in request and (not is_number(request["time_budget"]) or request["time_budget"] < 0):
+        raise ValueError("\"time_budget\" must be a non negative number of seconds.")
+
+    return request
+
+
+async def send_response(writer: asyncio.StreamWriter, status: int, body: dict):
+    """
+    Send a whole JSON response.
+    """
+    data = json.dumps(body).encode()
+    writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+
+
+async def send_chunk(writer: asyncio.StreamWriter, message: dict):
+    """
+    Send one line of a streamed response, as a chunk.
+    """
+    data = json.dumps(message).encode() + b"\n"
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+    await writer.drain()
+
+
+async def wait_for_end(reader: asyncio.StreamReader):
+    """
+    Wait until the client closes its side of the connection, or the connection breaks.
+    """
+    try:
+        await reader.read()
+    except ConnectionError:
+        pass
+
+
+async def handle_connection(service: MeshingService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Serve one HTTP request:
+    - GET /status: the service's status.
+    - POST /jobs: run a job (see parse_request), and stream its results as lines of JSON: {"triangles": [[p1, p2,
+      p3], ...]} as the triangles are made, and then {"done": stats} or {"error": message}. Triangles are rows of
+      point ids, in the order of the loaded cloud. If the client goes away, the job is cancelled.
+    """
+    job = None
+    client_gone = None
+
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+
+            if not line:
+                break
+
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if len(request_line) < 2:
+            return
+
+        method, target = request_line[0], request_line[1]
+
+        if target == "/status":
+            await send_response(writer, 200, service.status())
+            return
+
+        if target != "/jobs":
+            await send_response(writer, 404, {"error": f"Unknown path {target}."})
+            return
+
+        if method != "POST":
+            await send_response(writer, 405, {"error": "Jobs are submitted with POST."})
+            return
+
+        try:
+            content_length = int(headers.get("content-length", 0))
+
+            if content_length > MAX_BODY_SIZE:
+                await send_response(writer, 413, {"error": f"The request is larger than {MAX_BODY_SIZE} bytes."})
+                return
+
+            request = parse_request(await reader.readexactly(content_length))
+        except (ValueError, OSError) as error:
+            await send_response(writer, 400, {"error": str(error)})
+            return
+
+        job = await service.submit(request)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                     b"Connection: close\r\n\r\n")
+
+        # The client sends nothing after its request, so the end of its stream means it went away. Waiting for it
+        # along with the job's messages cancels the job at once, not at the next write.
+        client_gone = asyncio.ensure_future(wait_for_end(reader))
+
+        while True:
+            next_message = asyncio.ensure_future(job.messages.get())
+            await asyncio.wait((next_message, client_gone), return_when=asyncio.FIRST_COMPLETED)
+
+            if not next_message.done():
+                next_message.cancel()
+                return
+
+            kind, payload = next_message.result()
+
+            if kind == "triangles":
+                await send_chunk(writer, {"triangles": payload.tolist()})
+            else:
+                await send_chunk(writer, {kind: payload})
+                break
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        job = None
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        # The client went away before the job was done.
+        if job is not None:
+            service.cancel(job)
+
+        if client_gone is not None:
+            client_gone.cancel()
+
+        writer.close()
+
+
+async def serve(num_workers: int, host: str = "127.0.0.1", port: int = 8765, unix_path: str = None,
+                cache_size: int = CACHE_SIZE):
+    """
+    Run the meshing service until it is stopped.
+
+    :param num_workers: Number of worker processes.
+    :param host: Address to listen on.
+    :param port: Port to listen on.
+    :param unix_path: Path of a Unix socket to listen on instead, or None.
+    :param cache_size: Number of clouds each worker caches.
+    """
+    service = MeshingService(num_workers, cache_size)
+    await service.start()
+
+    def handler(reader, writer):
+        return handle_connection(service, reader, writer)
+
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+    else:
+        server = await asyncio.start_server(handler, host=host, port=port)
+
+    print(f"Serving on {unix_path or f'{host}:{port}'} with {num_workers} workers", flush=True)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    # Run the meshing service: python service.py [--port 8765 | --unix /tmp/bpa.sock] [--workers 4]
+    parser = argparse.ArgumentParser(description="Local ball pivoting meshing service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--unix", default=None, help="Path of a Unix socket to listen on instead.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="Number of clouds each worker caches.")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(max(args.workers, 1), host=args.host, port=args.port, unix_path=args.unix,
+                          cache_size=args.cache_size))
+    except KeyboardInterrupt:
+        pass
@@ -1,71 +1,320 @@
+from typing import List
+import numpy as np
 from Tracker import Edge
+from point import PointCloud
 import helper
 
+# Offsets from a cell to itself and the 26 cells around it.
+NEIGHBOR_OFFSETS = np.array([[i, j, k] for i in range(-1, 2) for j in range(-1, 2) for k in range(-1, 2)],
+                            dtype=np.int64)
+
 
 class Grid:
     def __init__(self, radius, points=None):
         self.all_points = points
-        self.cells = {} #dictionary
         self.radius = radius
         self.num_cells_per_axis = 0
         self.bounding_box_size = 0
-        self.edges = []
-        self.triangles = []
+        self.min_corner = np.zeros(3)
         self.cell_size = 0
 
+        # Cells are stored CSR style: the points of the cell cell_keys[i] are
+        # cell_points[cell_offsets[i]:cell_offsets[i + 1]]. cell_keys is sorted.
+        self.cell_keys = np.empty(0, dtype=np.int64)
+        self.cell_offsets = np.zeros(1, dtype=np.int64)
+        self.cell_points = np.empty(0, dtype=np.int64)
+        self.point_cells = np.empty(0, dtype=np.int64)  # Point id -> index of its cell in cell_keys.
+
+        # The occupied neighbour cells of cell i are neighbor_cells[neighbor_offsets[i]:neighbor_offsets[i + 1]].
+        self.neighbor_offsets = np.zeros(1, dtype=np.int64)
+        self.neighbor_cells = np.empty(0, dtype=np.int64)
+
+        self.edges = {}  # Edge key (smaller point id, larger point id) -> Edge.
+        self.adjacency = {}  # Point id -> set of ids of the points it is connected to.
+        self.triangles = []
+        self.edge_triangles = {}  # Edge key -> ids of the third points of the (at most two) triangles on the edge.
+        # Edge key -> ids of the third points of the mesh's triangles on the edge. Unlike edge_triangles, it does not have
+        # the closed paths that were recorded as triangles (see BPA.find_closing_point).
+        self.edge_faces = {}
+
         if points is not None:
             self.data_init(points)
 
-    def data_init(self, list_of_points):
-        min_x, max_x, min_y, max_y, min_z, max_z = 0, 0, 0, 0, 0, 0
+    def data_init(self, points: PointCloud):
+        if len(points) == 0:
+            return
+
+        coordinates = points.coordinates
 
         # Find boundaries for the bounding box of the entire data.
-        for point in list_of_points:
-            min_x = point.x if point.x < min_x else min_x
-            max_x = point.x if point.x > max_x else max_x
-            min_y = point.y if point.y < min_y else min_y
-            max_y = point.y if point.y > max_y else max_y
-            min_z = point.z if point.z < min_z else min_z
-            max_z = point.z if point.z > max_z else max_z
-
-        x = max_x - min_x
-        y = max_y - min_y
-        z = max_z - min_z
+        self.min_corner = coordinates.min(axis=0).astype(np.float64)
+        max_corner = coordinates.max(axis=0).astype(np.float64)
 
         # Considering the bounding box is square
-        self.bounding_box_size = max(x, y, z)
+        self.bounding_box_size = float(np.max(max_corner - self.min_corner))
+
+        # Each cell edge is the diameter of the ball.
+        self.cell_size = 2 * self.radius
+        self.num_cells_per_axis = int(self.bounding_box_size // self.cell_size) + 1
+
+        if self.num_cells_per_axis > helper.MAX_CELL_COORDINATE + 1:
+            raise ValueError(f"Radius {self.radius} is too small for the point cloud: the grid would need "
+                             f"{self.num_cells_per_axis} cells per axis, more than {helper.MAX_CELL_COORDINATE + 1}.")
+
+        # Find the cell of each point, relative to the bounding box minimum.
+        cells = self.get_cell_coordinates(coordinates)
+
+        # Encode cell location.
+        codes = helper.encode_cell(x=cells[:, 0], y=cells[:, 1], z=cells[:, 2])
+        points.cell_codes[:] = codes
+
+        # Group the point ids by cell.
+        self.cell_points = np.argsort(codes, kind="stable")
+        self.cell_keys, starts = np.unique(codes[self.cell_points], return_index=True)
+        self.cell_offsets = np.append(starts, len(codes)).astype(np.int64)
+        self.point_cells = np.empty(len(codes), dtype=np.int64)
+        self.point_cells[self.cell_points] = np.repeat(np.arange(len(self.cell_keys)), np.diff(self.cell_offsets))
+
+        self.build_neighbor_table()
+
+    def set_radius(self, radius):
+        """
+        Rebuild the cells for a new ball radius. The mesh (edges, triangles and their incidences) is kept.
+
+        :param radius: The new radius.
+        """
+        self.radius = radius
+
+        if self.all_points is not None:
+            self.data_init(self.all_points)
+
+    def copy_cells(self, points: PointCloud) -> "Grid":
+        """
+        Make a grid with the same cells, for a cloud of the same points, and an empty mesh. The cells arrays are
+        shared, not copied, since the grid never changes them in place.
+
+        :param points: The cloud, with the same coordinates as this grid's cloud.
+        :return: The new grid.
+        """
+        grid = Grid(radius=self.radius)
+        grid.all_points = points
+
+        for name in ("num_cells_per_axis", "bounding_box_size", "min_corner", "cell_size", "cell_keys",
+                     "cell_offsets", "cell_points", "point_cells", "neighbor_offsets", "neighbor_cells"):
+            setattr(grid, name, getattr(self, name))
+
+        points.cell_codes[:] = self.all_points.cell_codes
+        return grid
+
+    def build_neighbor_table(self):
+        """
+        Find the occupied neighbour cells of every occupied cell, once.
+        """
+        cells = np.stack([helper.compact_bits(self.cell_keys >> axis) for axis in range(3)], axis=1)
+        table = np.full((len(self.cell_keys), len(NEIGHBOR_OFFSETS)), -1, dtype=np.int64)
+
+        for column, offset in enumerate(NEIGHBOR_OFFSETS):
+            neighbors = cells + offset
+            inside = np.all((neighbors >= 0) & (neighbors < self.num_cells_per_axis), axis=1)
+            neighbors = np.clip(neighbors, 0, self.num_cells_per_axis - 1)
+
+            codes = helper.encode_cell(neighbors[:, 0], neighbors[:, 1], neighbors[:, 2])
+            indices = np.minimum(np.searchsorted(self.cell_keys, codes), len(self.cell_keys) - 1)
+            found = inside & (self.cell_keys[indices] == codes)
+            table[found, column] = indices[found]
+
+        is_occupied = table >= 0
+        self.neighbor_offsets = np.concatenate(([0], np.cumsum(is_occupied.sum(axis=1))))
+        self.neighbor_cells = table[is_occupied]
+
+    def get_cell_coordinates(self, coordinates: np.ndarray) -> np.ndarray:
+        """
+        Find the cells of points.
+
+        :param coordinates: N x 3 array of point coordinates.
+        :return: N x 3 int64 array of cell coordinates.
+        """
+        cells = np.floor((coordinates - self.min_corner) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.num_cells_per_axis - 1)
+
+    def get_cell_points(self, cell_code) -> np.ndarray:
+        """
+        Find the ids of the points in a cell.
 
-        # Calculate each cell edge size.
-        self.num_cells_per_axis = self.bounding_box_size / (2 * self.radius)
-        self.cell_size = self.bounding_box_size / self.num_cells_per_axis
+        :param cell_code: Code of the cell.
+        :return: Array of point ids.
+        """
+        i = np.searchsorted(self.cell_keys, cell_code)
 
-        # Start appending the data points to their cells.
-        for point in list_of_points:
-            x_cell = int((point.x // self.cell_size) * self.cell_size)
-            y_cell = int((point.y // self.cell_size) * self.cell_size)
-            z_cell = int((point.z // self.cell_size) * self.cell_size)
+        if i == len(self.cell_keys) or self.cell_keys[i] != cell_code:
+            return self.cell_points[:0]
 
-            # Encode cell location.
-            code = helper.encode_cell(x=x_cell, y=y_cell, z=z_cell)
-            point.cell_code = code
+        return self.cell_points[self.cell_offsets[i]:self.cell_offsets[i + 1]]
 
-            # Add the point to the cell in the hash table.
-            if code not in self.cells.keys():
-                self.cells[code] = []
+    def get_neighbor_cells(self, cell) -> np.ndarray:
+        """
+        Find the cell and all the occupied cells around it.
 
-            self.cells[code].append(point)
+        :param cell: Index of the cell in cell_keys.
+        :return: Array of cell indices.
+        """
+        return self.neighbor_cells[self.neighbor_offsets[cell]:self.neighbor_offsets[cell + 1]]
 
-    def get_cell_points(self, cell_code):
-        points = []
+    def get_neighborhood_points(self, p) -> np.ndarray:
+        """
+        Find the points in the cell of a point and in the cells around it.
 
-        if cell_code in self.cells.keys():
-            p = self.cells[cell_code]
-            points.extend(p)
+        :param p: Id of the point.
+        :return: Array of point ids.
+        """
+        cells = self.get_neighbor_cells(self.point_cells[p])
+        starts = self.cell_offsets[cells]
+        lengths = self.cell_offsets[cells + 1] - starts
 
-        return points
+        # Concatenate the cells' ranges of cell_points in one gather.
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1]) + np.repeat(starts - (ends - lengths), lengths)
+        return self.cell_points[positions]
+
+    def find_neighbor_points(self, p) -> np.ndarray:
+        """
+        Find the points that are within 2r distance from a point, including the point itself.
+
+        :param p: Id of the point.
+        :return: Array of point ids.
+        """
+        coordinates = self.all_points.coordinates
+        candidates = self.get_neighborhood_points(p)
+        dists = helper.calc_distance_points(coordinates[p], coordinates[candidates])
+        return candidates[dists <= 2 * self.radius]
+
+    def find_common_neighbor_points(self, p1, p2) -> np.ndarray:
+        """
+        Find the points that are within 2r distance from both of two points. Only these points can be on a ball with
+        radius r together with the two points.
+
+        :param p1: Id of the first point.
+        :param p2: Id of the second point.
+        :return: Array of point ids.
+        """
+        coordinates = self.all_points.coordinates
+        candidates = self.get_neighborhood_points(p1)
+        candidate_coordinates = coordinates[candidates]
+        dists_p1 = helper.calc_distance_points(coordinates[p1], candidate_coordinates)
+        dists_p2 = helper.calc_distance_points(coordinates[p2], candidate_coordinates)
+        return candidates[(dists_p1 <= 2 * self.radius) & (dists_p2 <= 2 * self.radius)]
+
+    @staticmethod
+    def edge_key(p1, p2) -> tuple:
+        """
+        Build the key of the unordered edge between two points.
+
+        :param p1: Id of the first point.
+        :param p2: Id of the second point.
+        :return: Tuple of the smaller and the larger point id.
+        """
+        return (p1, p2) if p1 < p2 else (p2, p1)
+
+    def get_edge(self, p1, p2):
+        """
+        Find the edge connecting two points.
+
+        :param p1: Id of the first point.
+        :param p2: Id of the second point.
+        :return: The edge, or None if the points are not connected.
+        """
+        return self.edges.get(self.edge_key(p1, p2))
+
+    def get_neighbors(self, p) -> set:
+        """
+        Find the ids of all points connected to a point by an edge.
+
+        :param p: Id of the point.
+        :return: Set of point ids.
+        """
+        return self.adjacency.get(p, set())
 
     def add_edge(self, edge: Edge):
-        self.edges.append(edge)
+        self.edges[self.edge_key(edge.p1, edge.p2)] = edge
+
+        if edge.p1 not in self.adjacency:
+            self.adjacency[edge.p1] = set()
+        if edge.p2 not in self.adjacency:
+            self.adjacency[edge.p2] = set()
+
+        self.adjacency[edge.p1].add(edge.p2)
+        self.adjacency[edge.p2].add(edge.p1)
 
     def remove_edge(self, edge: Edge):
-        self.edges.remove(edge)
+        del self.edges[self.edge_key(edge.p1, edge.p2)]
+        self.adjacency[edge.p1].discard(edge.p2)
+        self.adjacency[edge.p2].discard(edge.p1)
+
+    def get_edge_triangles(self, p1, p2) -> list:
+        """
+        Find the triangles the edge between two points is in.
+
+        :param p1: Id of the first point of the edge.
+        :param p2: Id of the second point of the edge.
+        :return: List with the id of the third point of each triangle.
+        """
+        return self.edge_triangles.get(self.edge_key(p1, p2), [])
+
+    def get_edge_faces(self, p1, p2) -> list:
+        """
+        Find the triangles of the mesh the edge between two points is in.
+
+        :param p1: Id of the first point of the edge.
+        :param p2: Id of the second point of the edge.
+        :return: List with the id of the third point of each triangle.
+        """
+        return self.edge_faces.get(self.edge_key(p1, p2), [])
+
+    def count_boundary_edges(self) -> int:
+        """
+        Count the edges on the mesh's boundary: the edges of a single triangle.
+
+        :return: Number of boundary edges.
+        """
+        return sum(1 for faces in self.edge_faces.values() if len(faces) == 1)
+
+    def euler_characteristic(self) -> int:
+        """
+        Find the Euler characteristic of the mesh, V - E + F, over the points and edges of its triangles. A closed mesh
+        of a sphere has 2, and each hole or handle takes some away.
+
+        :return: The Euler characteristic.
+        """
+        num_points = len(set(point for triangle in self.triangles for point in triangle))
+        return num_points - len(self.edge_faces) + len(self.triangles)
+
+    def add_edge_triangle(self, p1, p2, third_point_id):
+        """
+        Record that the edge between two points is part of a triangle.
+
+        :param p1: Id of the first point of the edge.
+        :param p2: Id of the second point of the edge.
+        :param third_point_id: Id of the third point of the triangle.
+        """
+        key = self.edge_key(p1, p2)
+
+        if key not in self.edge_triangles:
+            self.edge_triangles[key] = []
+
+        if third_point_id not in self.edge_triangles[key]:
+            self.edge_triangles[key].append(third_point_id)
+
+    def add_triangle(self, triangle: List):
+        """
+        Add a triangle to the mesh and record it on each of its edges.
+
+        :param triangle: List of the ids of the 3 points of the triangle.
+        """
+        p1, p2, p3 = triangle
+        self.triangles.append(triangle)
+        self.add_edge_triangle(p1, p2, p3)
+        self.add_edge_triangle(p2, p3, p1)
+        self.add_edge_triangle(p1, p3, p2)
+
+        for a, b, c in ((p1, p2, p3), (p2, p3, p1), (p1, p3, p2)):
+            self.edge_faces.setdefault(self.edge_key(a, b), []).append(c)
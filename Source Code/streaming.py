@@ -0,0 +1,125 @@
+import bisect
+import os
+import numpy as np
+from ball_pivoting_algo import BPA, fill_missing_normals
+from mesh_io import MESH_EXTENSIONS, MeshWriter
+from point import PointCloud
+from point_io import load_points
+
+# Number of points in a slab.
+SLAB_SIZE = 1 << 20
+
+
+def stream_mesh(input_path: str, radius: float, output_path: str, slab_size: int = SLAB_SIZE,
+                limit_iterations: int = np.inf, use_cache: bool = True) -> int:
+    """
+    Mesh a point cloud that does not fit in memory, slab by slab along the x axis. The cloud is memory-mapped through
+    the binary cache, and only one slab, with the strip of the mesh along its sides, is in memory at a time:
+    - New triangles can only use the points of the slab, and the edges near its far side are put aside until the next
+      slab is loaded, since the ball could hit points that are not loaded yet.
+    - Triangles that no later slab can touch are written to the output file and dropped. The rest are carried to the
+      next slab with the edges that were put aside.
+
+    A .ply, .stl or .obj output file gets all the points as its vertices (see mesh_io.MeshWriter). Any other output file
+    is a flat array of little endian int64 point ids, 3 for each triangle. The ids are in the order of the points in
+    the loaded cloud. Missing normals are estimated for the whole cloud before the first slab, so a cloud without
+    normals takes a normals array in memory.
+
+    :param input_path: Path of the point cloud file. The points must be sorted by x, as the text and OBJ loaders sort
+    them.
+    :param radius: Radius of the ball.
+    :param output_path: Path of the triangles file.
+    :param slab_size: Number of points in a slab. A slab is made wider if it is narrower than 8r.
+    :param limit_iterations: Maximal number of iterations for each slab.
+    :param use_cache: Whether to load the cloud through the binary cache.
+    :return: Number of triangles written.
+    """
+    # Slabs must see the same normals as the whole cloud, or their orientations would not agree across the walls.
+    points = fill_missing_normals(load_points(input_path, use_cache=use_cache))
+    x = points.coordinates[:, 0]
+    num_points = len(points)
+
+    # Check the order a slab at a time, so a memory-mapped cloud is not read into memory at once.
+    for slab_start in range(0, num_points, slab_size):
+        slab_x = np.array(x[slab_start:slab_start + slab_size + 1])
+
+        if np.any(slab_x[1:] < slab_x[:-1]):
+            raise ValueError(f"{input_path} is not sorted by x, and can not be meshed slab by slab.")
+
+    # Triangles that later slabs might touch, edges put aside, as point ids of the whole cloud.
+    carried_triangles = np.empty((0, 3), dtype=np.int64)
+    deferred_edges = np.empty((0, 2), dtype=np.int64)
+
+    # Written triangles that share a point with the carried ones. The next slab needs them to know which edges of the
+    # carried triangles are closed, but does not write them again.
+    context_triangles = np.empty((0, 3), dtype=np.int64)
+
+    previous_wall = -np.inf
+    slab_end = 0
+    num_triangles = 0
+
+    if os.path.splitext(output_path)[1].lower() in MESH_EXTENSIONS:
+        writer = MeshWriter(output_path, points.coordinates, points.normals)
+        write_triangles = writer.write_faces
+    else:
+        writer = open(output_path, "wb")
+        write_triangles = lambda triangles: triangles.astype("<i8").tofile(writer)
+
+    with writer:
+        while previous_wall < np.inf:
+            # New triangles can use the points from 6r before the previous wall up to this slab's wall. The points
+            # 2r after that range are loaded as well, for the ball to see them, and the points 4r before it, for the
+            # context triangles.
+            slab_end = min(slab_end + slab_size, num_points)
+            wall = float(x[slab_end]) if slab_end < num_points else np.inf
+            wall = max(wall, previous_wall + 8 * radius)
+            slab_end = bisect.bisect_left(x, wall, slab_end)
+
+            start = bisect.bisect_left(x, previous_wall - 10 * radius)
+            end = bisect.bisect_left(x, wall + 2 * radius, slab_end)
+            window_x = np.array(x[start:end])
+
+            bpa = BPA(None, radius, points=PointCloud(points.coordinates[start:end], points.normals[start:end]))
+            bpa.x_range = (previous_wall - 6 * radius, wall)
+
+            # Points before the previous wall's strip already had their chance to start a seed triangle.
+            bpa.seed_rejected |= (window_x < previous_wall - 2 * radius) | (window_x >= wall)
+
+            # Continue the mesh of the previous slab.
+            bpa.add_triangles(context_triangles - start)
+            bpa.add_triangles(carried_triangles - start)
+
+            for p1, p2 in (deferred_edges - start).tolist():
+                edge = bpa.grid.get_edge(p1, p2)
+
+                if edge is not None:
+                    bpa.push_front(edge)
+
+            bpa.generate_mesh(limit_iterations=limit_iterations)
+            bpa.fill_closed_paths((window_x >= bpa.x_range[0]) & (window_x < wall))
+
+            # Triangles with all their points 6r before the wall are final.
+            triangles = np.array(bpa.grid.triangles[len(context_triangles):], dtype=np.int64).reshape(-1, 3)
+            is_final = window_x[triangles].max(axis=1) < wall - 6 * radius
+            write_triangles(triangles[is_final] + start)
+            num_triangles += int(np.count_nonzero(is_final))
+
+            carried_triangles = triangles[~is_final] + start
+            final_triangles = triangles[is_final] + start
+            context_triangles = final_triangles[np.isin(final_triangles, carried_triangles).any(axis=1)]
+            open_edges = bpa.deferred_edges + [edge for _, _, edge in bpa.front]
+            deferred_edges = np.array([[edge.p1, edge.p2] for edge in open_edges
+                                       if len(bpa.grid.get_edge_triangles(edge.p1, edge.p2)) < 2],
+                                      dtype=np.int64).reshape(-1, 2) + start
+
+            previous_wall = wall
+
+    return num_triangles
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Mesh a point cloud slab by slab: python streaming.py input radius output [slab_size]
+    slab_size = int(sys.argv[4]) if len(sys.argv) > 4 else SLAB_SIZE
+    print(stream_mesh(sys.argv[1], float(sys.argv[2]), sys.argv[3], slab_size=slab_size))